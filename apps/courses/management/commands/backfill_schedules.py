@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.courses.models import Meeting, OpenedSection, Semester
+
+
+class Command(BaseCommand):
+    help = "Compute the packed schedule of opened sections from their meetings"
+
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "semesters",
+            type=int,
+            nargs="*",
+            help="Codes of the semesters to backfill. Backfills every semester if none is given",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute the schedules that are already computed as well",
+        )
+
+    def handle(self, *args, **options):
+        queryset = OpenedSection.objects.order_by("id")
+        if options["semesters"]:
+            semesters = Semester.objects.filter(code__in=options["semesters"])
+            unknown = set(options["semesters"]) - {s.code for s in semesters}
+            if unknown:
+                raise CommandError(f"Unknown semesters: {sorted(unknown)}")
+            queryset = queryset.filter(semester__in=semesters)
+        if not options["all"]:
+            queryset = queryset.filter(schedule__isnull=True)
+
+        ids = list(queryset.values_list("id", flat=True))
+        for idx in range(0, len(ids), self.batch_size):
+            batch = ids[idx : idx + self.batch_size]
+
+            timeslots = defaultdict(list)
+            for id_, *timeslot in Meeting.objects.filter(
+                opened_section_id__in=batch
+            ).values_list(
+                "opened_section_id",
+                "day__day",
+                "duration__start_time",
+                "duration__end_time",
+            ):
+                timeslots[id_].append(tuple(timeslot))
+
+            OpenedSection.objects.bulk_update(
+                [
+                    OpenedSection(
+                        id=id_, schedule=OpenedSection.to_schedule(timeslots[id_])
+                    )
+                    for id_ in batch
+                ],
+                ["schedule"],
+            )
+            self.stdout.write(f"Backfilled {idx + len(batch)}/{len(ids)} sections")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully backfilled {len(ids)} schedules")
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2024-03-10 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0022_remove_building_latitude_remove_building_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='openedsection',
+            name='schedule',
+            field=models.JSONField(blank=True, null=True, verbose_name='Sorted [day, start minute, end minute] of the meetings'),
+        ),
+    ]
@@ -71,10 +71,38 @@ class OpenedSection(models.Model):
     holdfile = models.IntegerField(
         "Number of people on waitlist with lower priority", blank=True, null=True
     )
+    schedule = models.JSONField(
+        "Sorted [day, start minute, end minute] of the meetings",
+        blank=True,
+        null=True,
+    )
 
     def __str__(self):
         return f"{self.section} at {self.semester}"
 
+    @staticmethod
+    def to_schedule(timeslots):
+        """
+        Convert (day, start time, end time) of meetings to a sorted list of distinct [day, start minute, end minute].
+        """
+
+        return [
+            [day, start.hour * 60 + start.minute, end.hour * 60 + end.minute]
+            for day, start, end in sorted(set(timeslots))
+        ]
+
+    def update_schedule(self):
+        """
+        Recompute the schedule from the meetings of this section and save it.
+        """
+
+        self.schedule = self.to_schedule(
+            Meeting.objects.filter(opened_section=self).values_list(
+                "day__day", "duration__start_time", "duration__end_time"
+            )
+        )
+        self.save(update_fields=["schedule"])
+
 
 class Instructor(models.Model):
     name = models.CharField(max_length=255)
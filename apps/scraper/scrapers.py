@@ -20,6 +20,7 @@ from apps.courses.models import (
     Teach,
 )
 from apps.scraper.utils import timeit
+from apps.wizard.cache import bump_data_version
 
 
 class UMDScraper:
@@ -639,5 +640,11 @@ class UMDScraper:
                 remove_meetings_ids = [m.id for m in remove_meetings]
                 Meeting.objects.filter(id__in=remove_meetings_ids).delete()
 
+                # keep the packed schedule read by the wizard in sync with the meetings
+                opened_section.update_schedule()
+
+        # results cached by the wizard are stale now
+        bump_data_version(sem.id)
+
 
 scrapers = {"University of Maryland": UMDScraper()}
@@ -3,4 +3,4 @@ from django.apps import AppConfig
 
 class WizardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'wizard'
+    name = 'apps.wizard'
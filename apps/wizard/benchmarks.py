@@ -0,0 +1,210 @@
+import random
+from datetime import time
+from time import perf_counter
+
+from apps.courses.models import (
+    Building,
+    Course,
+    Day,
+    Duration,
+    Institution,
+    Instructor,
+    Location,
+    Meeting,
+    OpenedSection,
+    Section,
+    Semester,
+    Teach,
+)
+from apps.wizard.mixins import GenerateTimeTableMixin
+
+BENCHMARK_DAYS = ("M", "Tu", "W", "Th", "F")
+BENCHMARK_OPTIONS = {
+    "minimum_start_time": "00:00",
+    "minimum_interval": "00:10",
+    "maximum_interval": "23:59",
+    "allow_consec": 3,
+    "allow_one_class_a_day": True,
+    "allow_only_open_section": False,
+}
+
+# groups: number of groups, i.e. courses
+# sections: number of sections per group
+# meetings: number of meetings per week of each section
+# overlap: from 0 to 1, how tightly the classes are packed into the day, i.e. how often they overlap
+SCENARIOS = {
+    "small": {"groups": 3, "sections": 8, "meetings": 2, "overlap": 0.3},
+    # the shape of a usual request, like test/request.json: a full-time load of lectures with discussions
+    "typical": {"groups": 5, "sections": 12, "meetings": 3, "overlap": 0.4},
+    "dense": {"groups": 4, "sections": 24, "meetings": 2, "overlap": 0.6},
+    "wide": {"groups": 7, "sections": 10, "meetings": 2, "overlap": 0.2},
+}
+
+
+def synthetic_timeslots(rng: random.Random, meetings: int, overlap: float):
+    """
+    Returns a random set of (day, start time, end time) shaped like the ones of the catalog: a class at the same
+    time on `meetings` days of the week, 50 minutes long on 3 days or more and 75 minutes long otherwise.
+
+    :param rng: The random number generator
+    :param meetings: The number of meetings per week
+    :param overlap: From 0 to 1, how tightly the classes are packed into the day
+    """
+
+    duration = 50 if meetings >= 3 else 75
+    window = max(round(10 * 60 * (1 - overlap)), 60)
+    start = 8 * 60 + rng.randrange(0, window, 15)
+    days = rng.sample(BENCHMARK_DAYS, min(meetings, len(BENCHMARK_DAYS)))
+
+    return {
+        (day, time(*divmod(start, 60)), time(*divmod(start + duration, 60)))
+        for day in days
+    }
+
+
+def create_catalog(groups, sections, meetings, overlap, seed=0):
+    """
+    Create a synthetic catalog of `groups` courses with `sections` opened sections each. Returns their ids grouped by
+    course, the way they are sent to the wizard.
+
+    :param groups: The number of groups, i.e. courses
+    :param sections: The number of sections per group
+    :param meetings: The number of meetings per week of each section
+    :param overlap: From 0 to 1, how tightly the classes are packed into the day
+    :param seed: The seed of the catalog
+    """
+
+    rng = random.Random(seed)
+    institution = Institution.objects.create(
+        full_name="Benchmark University", nickname="BU"
+    )
+    semester = Semester.objects.create(code=100001)
+    location = Location.objects.create(
+        room="1", building=Building.objects.create(nickname="BENCH")
+    )
+    instructor = Instructor.objects.create(name="Benchmark Instructor")
+    days = {day: Day.objects.get_or_create(day=day)[0] for day in BENCHMARK_DAYS}
+    durations = {}
+
+    opened_section_id_groups = []
+    for course_idx in range(groups):
+        course = Course.objects.create(
+            name=f"Benchmark Course {course_idx}",
+            course_code=f"BENCH{course_idx:03}",
+            credits=3,
+            institution=institution,
+        )
+        group = []
+        for section_idx in range(sections):
+            opened_section = OpenedSection.objects.create(
+                semester=semester,
+                section=Section.objects.create(
+                    course=course, section_code=f"{section_idx + 1:04}"
+                ),
+                seats=30,
+                open_seats=rng.randint(0, 30),
+            )
+            timeslots = synthetic_timeslots(rng, meetings, overlap)
+            for day, start_time, end_time in timeslots:
+                if (start_time, end_time) not in durations:
+                    durations[(start_time, end_time)] = Duration.objects.get_or_create(
+                        start_time=start_time, end_time=end_time
+                    )[0]
+                Meeting.objects.create(
+                    duration=durations[(start_time, end_time)],
+                    day=days[day],
+                    location=location,
+                    opened_section=opened_section,
+                )
+            Teach.objects.create(instructor=instructor, opened_section=opened_section)
+            group.append(opened_section.id)
+        opened_section_id_groups.append(group)
+
+    return opened_section_id_groups
+
+
+def timed(results: dict, phase: str, func, *args):
+    """
+    Call func with args, and record how long it took in results[phase]. Returns what func returned.
+    """
+
+    started = perf_counter()
+    result = func(*args)
+    results[phase] = perf_counter() - started
+    return result
+
+
+def benchmark_request(opened_section_id_groups, options, workers=()):
+    """
+    Time the phases of GenerateTimeTableMixin.get_timetables_count and GenerateTimeTableMixin.get_timetables, without
+    the result cache: loading the groups from the database, the search, and the realization of the timetables.
+    Returns a dictionary of phase names to seconds, and of "count" and "timetables" to the numbers of timetables.
+
+    :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+    :param options: A dictionary of options
+    :param workers: Numbers of worker processes to also time the search with
+    """
+
+    results = {}
+
+    mixin = GenerateTimeTableMixin()
+    timed(
+        results,
+        "count_load",
+        mixin.prepare_groups,
+        opened_section_id_groups,
+        options,
+        False,
+    )
+    results["count"] = timed(results, "count_search", mixin.count_timetables)
+
+    mixin = GenerateTimeTableMixin()
+    timed(
+        results,
+        "timetables_load",
+        mixin.prepare_groups,
+        opened_section_id_groups,
+        options,
+    )
+    timed(results, "timetables_search", mixin.generate_timetables)
+    timed(results, "timetables_realize", mixin.realize_timetables)
+    results["timetables"] = len(mixin.realized_timetables)
+    results["truncated"] = mixin.search_truncated
+
+    for n_workers in workers:
+        mixin._workers = n_workers
+        # start the pool outside of the timing
+        mixin.count_timetables()
+        timed(
+            results, f"timetables_search_{n_workers}_workers", mixin.generate_timetables
+        )
+
+    return results
+
+
+def find_regressions(
+    results: dict, baseline: dict, threshold: float, min_seconds: float = 0.02
+):
+    """
+    Compare two benchmark results, and return a list of (scenario, phase, baseline seconds, seconds) of the phases
+    that got slower than the baseline by more than the threshold, e.g. 0.2 for 20%. Phases faster than min_seconds
+    in both runs are too noisy to compare and are skipped.
+
+    :param results: A dictionary of scenario names to benchmark_request results
+    :param baseline: The same for the baseline run
+    :param threshold: The relative slowdown to tolerate
+    :param min_seconds: The duration under which phases are not compared
+    """
+
+    regressions = []
+    for scenario, phases in results.items():
+        for phase, seconds in phases.items():
+            before = baseline.get(scenario, {}).get(phase)
+            if not isinstance(seconds, float) or not isinstance(before, float):
+                continue
+            if max(seconds, before) < min_seconds:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append((scenario, phase, before, seconds))
+
+    return regressions
@@ -0,0 +1,152 @@
+import hashlib
+import json
+from threading import Lock
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+
+# hits and misses of the result cache in this process
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = Lock()
+
+
+def get_cache():
+    """
+    Returns the cache of wizard results, settings.WIZARD_CACHE_ALIAS of settings.CACHES.
+    """
+
+    return caches[getattr(settings, "WIZARD_CACHE_ALIAS", "default")]
+
+
+def canonical_groups(opened_section_id_groups: list[list[int]]) -> list[list[int]]:
+    """
+    Returns the groups with their IDs deduplicated and sorted, in sorted order, so that requests asking for the same
+    sections in a different order share their results.
+    """
+
+    return sorted(sorted(set(group)) for group in opened_section_id_groups)
+
+
+def get_data_version(semester_ids: list[int]) -> str:
+    """
+    Returns the data version of the given semesters. A version that is missing, e.g. after being evicted, is replaced
+    by a new one, so that results cached under the old one are never served again.
+
+    :param semester_ids: The ids of Semester objects
+    """
+
+    cache = get_cache()
+    versions = []
+    for semester_id in sorted(set(semester_ids)):
+        version = cache.get_or_set(
+            f"wizard:version:{semester_id}", time_ns, timeout=None
+        )
+        versions.append(f"{semester_id}.{version}")
+
+    return "-".join(versions)
+
+
+def bump_data_version(semester_id: int):
+    """
+    Invalidate every cached result built from the sections of a semester. Called whenever the sections are written.
+
+    :param semester_id: The id of a Semester object
+    """
+
+    get_cache().set(f"wizard:version:{semester_id}", time_ns(), timeout=None)
+
+
+def make_key(
+    kind: str,
+    opened_section_id_groups: list[list[int]],
+    options: dict,
+    version: str,
+    fixed_sections: tuple[int] = (),
+) -> str:
+    """
+    Returns the cache key of a wizard result.
+
+    :param kind: What the result is, e.g. "timetables" or "count"
+    :param opened_section_id_groups: The canonical groups, see canonical_groups
+    :param options: The validated options
+    :param version: The data version of the semesters of the groups, see get_data_version
+    :param fixed_sections: The sorted ids of the fixed sections, which are not excluded by the options
+    """
+
+    canonical = json.dumps(
+        [opened_section_id_groups, options, version, fixed_sections],
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"wizard:{kind}:{digest}"
+
+
+def get_result(key: str):
+    """
+    Returns the cached result of a key or None, and record a hit or a miss.
+    """
+
+    result = get_cache().get(key)
+    with _stats_lock:
+        _stats["hits" if result is not None else "misses"] += 1
+
+    return result
+
+
+def set_result(key: str, result, size: int):
+    """
+    Cache a result, unless its size exceeds settings.WIZARD_CACHE_MAX_RESULT_SIZE.
+
+    :param key: The key made by make_key
+    :param result: The result
+    :param size: The number of timetables in the result
+    """
+
+    max_size = getattr(settings, "WIZARD_CACHE_MAX_RESULT_SIZE", None)
+    if max_size is not None and size > max_size:
+        return
+
+    get_cache().set(key, result)
+
+
+def get_session(token: str):
+    """
+    Returns the state of an incremental wizard session, or None if it expired.
+
+    :param token: The token of the session
+    """
+
+    return get_cache().get(f"wizard:session:{token}")
+
+
+def set_session(token: str, state: dict):
+    """
+    Save the state of an incremental wizard session for settings.WIZARD_SESSION_TTL seconds.
+
+    :param token: The token of the session
+    :param state: The state of the session
+    """
+
+    get_cache().set(
+        f"wizard:session:{token}",
+        state,
+        getattr(settings, "WIZARD_SESSION_TTL", 30 * 60),
+    )
+
+
+def cache_stats() -> dict:
+    """
+    Returns the hits, misses and hit rate of the result cache in this process.
+    """
+
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
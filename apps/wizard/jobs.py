@@ -0,0 +1,173 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.wizard.mixins import GenerateTimeTableMixin
+from apps.wizard.models import WizardJob
+
+logger = logging.getLogger(__name__)
+
+# seconds between two saves of the progress counters of a running job
+PROGRESS_INTERVAL = 1
+
+_thread_pool = None
+
+
+def get_job_settings() -> dict:
+    """
+    Returns settings.WIZARD_JOBS, with the defaults of the missing keys.
+    """
+
+    return {
+        "WORKERS": 2,
+        "TTL": 60 * 60,
+        "MAX_ACTIVE_PER_USER": 2,
+        "GRACE": 60,
+        "SEARCH_LIMITS": getattr(settings, "WIZARD_SEARCH_LIMITS", {}),
+        **getattr(settings, "WIZARD_JOBS", {}),
+    }
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool that runs the wizard jobs of this process, created on first use.
+    """
+
+    global _thread_pool
+
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=get_job_settings()["WORKERS"],
+            thread_name_prefix="wizard-job",
+        )
+    return _thread_pool
+
+
+def live_jobs():
+    """
+    Returns the queryset of the jobs that are not expired yet.
+    """
+
+    expires = timezone.now() - timedelta(seconds=get_job_settings()["TTL"])
+    return WizardJob.objects.filter(created_at__gte=expires)
+
+
+def delete_expired_jobs():
+    """
+    Delete the jobs older than settings.WIZARD_JOBS["TTL"] seconds, finished or not.
+    """
+
+    expires = timezone.now() - timedelta(seconds=get_job_settings()["TTL"])
+    WizardJob.objects.filter(created_at__lt=expires).delete()
+
+
+def fail_stale_jobs():
+    """
+    Mark as failed the unfinished jobs that should have finished by now, the ones running or pending for longer than
+    the search deadline plus settings.WIZARD_JOBS["GRACE"] seconds. Their thread was lost, e.g. when the process was
+    restarted, and they would otherwise never finish and count as active until they expire.
+    """
+
+    job_settings = get_job_settings()
+    deadline = job_settings["SEARCH_LIMITS"].get("DEADLINE")
+    if deadline is None:
+        return
+
+    stale = timezone.now() - timedelta(seconds=deadline + job_settings["GRACE"])
+    WizardJob.objects.filter(
+        Q(status=WizardJob.RUNNING, started_at__lt=stale)
+        | Q(status=WizardJob.PENDING, created_at__lt=stale)
+    ).update(status=WizardJob.FAILED, error="Interrupted", finished_at=timezone.now())
+
+
+def submit_job(user, request: dict) -> WizardJob:
+    """
+    Create a job for a validated wizard request, and run it on the thread pool once the job is committed.
+    Raises PermissionError if the user already has settings.WIZARD_JOBS["MAX_ACTIVE_PER_USER"] unfinished jobs.
+
+    :param user: The user submitting the job
+    :param request: A dictionary of "groups", "options", and optional "fixed" and "budget"
+    """
+
+    delete_expired_jobs()
+    fail_stale_jobs()
+
+    with transaction.atomic():
+        # lock the user's row, so that concurrent submits of the user count their jobs one after the other. sqlite
+        # ignores select_for_update, but it serializes these writes anyway, as it lets a single transaction write at
+        # a time
+        get_user_model().objects.select_for_update().get(pk=user.pk)
+        active = (
+            live_jobs()
+            .filter(user=user, status__in=[WizardJob.PENDING, WizardJob.RUNNING])
+            .count()
+        )
+        if active >= get_job_settings()["MAX_ACTIVE_PER_USER"]:
+            raise PermissionError("Too many unfinished jobs")
+
+        job = WizardJob.objects.create(user=user, request=request)
+        transaction.on_commit(lambda: get_thread_pool().submit(run_job, job.id))
+
+    return job
+
+
+def run_job(job_id):
+    """
+    Run the search of a job, saving its progress counters every PROGRESS_INTERVAL seconds and its timetables as lists
+    of OpenedSection ids once it is done.
+
+    :param job_id: The id of a WizardJob
+    """
+
+    try:
+        # a job deleted in the meantime is not recreated, as every write is an update
+        jobs = WizardJob.objects.filter(id=job_id)
+        if not jobs.filter(status=WizardJob.PENDING).update(
+            status=WizardJob.RUNNING, started_at=timezone.now()
+        ):
+            return
+        request = jobs.values_list("request", flat=True).get()
+
+        mixin = GenerateTimeTableMixin()
+        outcome = {"status": WizardJob.DONE}
+        timetables = []
+        try:
+            mixin.set_budget(request.get("budget"), get_job_settings()["SEARCH_LIMITS"])
+            last_saved = monotonic()
+            opened_section_id_groups = mixin.with_fixed_sections(
+                request["groups"], request.get("fixed")
+            )
+            for table in mixin.iter_timetables(
+                opened_section_id_groups, request["options"]
+            ):
+                timetables.append([op_sec.id for op_sec in table])
+                if monotonic() - last_saved >= PROGRESS_INTERVAL:
+                    jobs.update(
+                        nodes=mixin.search_counters["nodes"], results=len(timetables)
+                    )
+                    last_saved = monotonic()
+            outcome["timetables"] = timetables
+            outcome["truncated"] = mixin.search_truncated
+        except ValueError as e:
+            outcome = {"status": WizardJob.FAILED, "error": str(e)}
+        except Exception:
+            logger.exception("Wizard job %s failed", job_id)
+            outcome = {"status": WizardJob.FAILED, "error": "Internal error"}
+
+        if mixin.search_counters is not None:
+            outcome["nodes"] = mixin.search_counters["nodes"]
+            mixin.log_search("job")
+        # a job taken for lost in the meantime stays failed
+        jobs.filter(status=WizardJob.RUNNING).update(
+            results=len(timetables), finished_at=timezone.now(), **outcome
+        )
+    finally:
+        # the connection belongs to the thread of the pool
+        connection.close()
@@ -0,0 +1,145 @@
+import json
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.wizard.benchmarks import (
+    BENCHMARK_OPTIONS,
+    SCENARIOS,
+    benchmark_request,
+    create_catalog,
+    find_regressions,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the wizard on synthetic catalogs, and compare the results with a previous run"
+
+    test_request = "test/request.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            choices=list(SCENARIOS),
+            default=list(SCENARIOS),
+            help="Scenarios to run",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the catalogs")
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of runs of each scenario, the fastest of which is kept",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="*",
+            default=[],
+            help="Numbers of worker processes to also time the search with",
+        )
+        parser.add_argument(
+            "--output", type=str, help="JSON file to write the results to"
+        )
+        parser.add_argument(
+            "--compare", type=str, help="JSON file of a previous run to compare with"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Relative slowdown over the previous run that fails the benchmark",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("The number of runs must be at least 1")
+        if any(workers < 2 for workers in options["workers"]):
+            raise CommandError("The numbers of worker processes must be at least 2")
+
+        baseline = None
+        if options["compare"] is not None:
+            if not os.path.isfile(options["compare"]):
+                raise CommandError(f"File does not exist: {options['compare']}")
+            with open(options["compare"]) as f:
+                baseline = json.load(f)["scenarios"]
+
+        # the synthetic catalogs are rolled back once measured
+        with transaction.atomic():
+            requests = {}
+            for name in options["scenarios"]:
+                requests[name] = (
+                    create_catalog(**SCENARIOS[name], seed=options["seed"]),
+                    BENCHMARK_OPTIONS,
+                )
+            if os.path.isfile(self.test_request):
+                with open(self.test_request) as f:
+                    test_request = json.load(f)
+                requests["test_request"] = (
+                    test_request["groups"],
+                    test_request["options"],
+                )
+
+            scenarios = {}
+            for name, (opened_section_id_groups, request_options) in requests.items():
+                runs = [
+                    benchmark_request(
+                        opened_section_id_groups, request_options, options["workers"]
+                    )
+                    for _ in range(options["repeat"])
+                ]
+                scenarios[name] = {
+                    key: (
+                        min(run[key] for run in runs)
+                        if isinstance(value, float)
+                        else value
+                    )
+                    for key, value in runs[0].items()
+                }
+                self.write_scenario(name, scenarios[name])
+
+            transaction.set_rollback(True)
+
+        if options["output"] is not None:
+            with open(options["output"], "w") as f:
+                json.dump(
+                    {
+                        "created_at": datetime.now().isoformat(),
+                        "repeat": options["repeat"],
+                        "seed": options["seed"],
+                        "scenarios": scenarios,
+                    },
+                    f,
+                    indent=2,
+                )
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = find_regressions(scenarios, baseline, options["threshold"])
+            for scenario, phase, before, seconds in regressions:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"{scenario} {phase}: {before:.4f}s -> {seconds:.4f}s "
+                        f"(+{seconds / before - 1:.0%})"
+                    )
+                )
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} phase(s) slower than {options['compare']} "
+                    f"by more than {options['threshold']:.0%}"
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f"No regression over {options['compare']}")
+            )
+
+    def write_scenario(self, name, results):
+        self.stdout.write(
+            f"{name}: {results['count']} counted, {results['timetables']} timetables"
+            + (" (truncated)" if results["truncated"] else "")
+        )
+        for phase, seconds in results.items():
+            if isinstance(seconds, float):
+                self.stdout.write(f"  {phase:<32} {seconds:.4f}s")
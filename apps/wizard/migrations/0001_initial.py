@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:14
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WizardJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "request",
+                    models.JSONField(
+                        verbose_name="Groups, options and budget of the search"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=7,
+                    ),
+                ),
+                (
+                    "nodes",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Number of search nodes visited"
+                    ),
+                ),
+                (
+                    "results",
+                    models.IntegerField(
+                        default=0, verbose_name="Number of timetables found"
+                    ),
+                ),
+                ("truncated", models.BooleanField(default=False)),
+                (
+                    "timetables",
+                    models.JSONField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Lists of OpenedSection ids of the timetables found",
+                    ),
+                ),
+                ("error", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
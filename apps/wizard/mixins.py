@@ -1,15 +1,69 @@
-from datetime import datetime, timedelta
-from functools import reduce
-
-from django.db.models import Prefetch, Exists, OuterRef
+import heapq
+import json
+import logging
+import random
+import re
+import uuid
+from bisect import bisect_left, insort
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.db.models import Prefetch, Q
 
 from apps.courses.models import Meeting, OpenedSection, Teach
+from apps.wizard.cache import (
+    canonical_groups,
+    get_data_version,
+    get_result,
+    get_session,
+    make_key,
+    set_result,
+    set_session,
+)
+from apps.wizard.parallel import get_process_pool, solve_subproblem
+from apps.wizard.utils import (
+    DAYS,
+    MINUTES_PER_DAY,
+    TimeSlotMasks,
+    bit_range,
+    decode_cursor,
+    encode_cursor,
+    idle_minutes,
+    iter_best_positions,
+    iter_bits,
+    iter_positions,
+    request_fingerprint,
+    slot_size,
+    to_masks,
+    to_minutes,
+    to_spans,
+    to_window,
+)
+
+logger = logging.getLogger(__name__)
+
+# classes with a gap of at most this many minutes are consecutive
+CONSEC_GAP = 15
+# bits per day of the minute bitmasks of compile_consec_reach, with room past midnight for the gap
+REACH_BITS_PER_DAY = MINUTES_PER_DAY + 2 * CONSEC_GAP
 
 
 def raise_(ex):
     raise ex
 
 
+class SearchBudgetExceeded(Exception):
+    """
+    Raised inside the search when the budget set by GenerateTimeTableMixin.set_budget is used up.
+    `partial` carries what was counted before the budget ran out.
+    """
+
+    partial = 0
+
+
 class GenerateTimeTableMixin:
     _opened_section_id_groups = None
     _groups: (
@@ -17,10 +71,73 @@ class GenerateTimeTableMixin:
         | None
     ) = None
     _options = None
+    _fixed_sections: tuple[int] = ()
+    _timeslot_spans: dict[tuple, tuple[tuple[int, int, int]]] | None = None
+    _timeslot_masks: dict[tuple, TimeSlotMasks] | None = None
+    _blocked_mask: int = 0
+    _candidates: list[tuple[tuple[str, datetime.time, datetime.time]]] | None = None
+    _group_candidates: list[range] | None = None
+    _group_masks: list[int] | None = None
+    _compatibles: list[int] | None = None
+    _weights: list[int] | None = None
+    _consec_binding: bool = True
+    _count_memo: dict[tuple, int] | None = None
+    _count_memo_hits: int = 0
+    _count_memo_optional: bool = False
+    _group_reach: list[int] | None = None
+    _day_spans: list[list[tuple[int, int]]] | None = None
+    _days_binding: bool = False
+    _candidate_days: list[int] | None = None
+    _candidate_day_classes: list[tuple[tuple[int, int]]] | None = None
+    _day_classes: list[int] | None = None
+    _campus_days: int = 0
+    _workers: int | None = None
     generated_timetables: list[
         dict[tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]]
     ] = None
     realized_timetables: list[list[OpenedSection]] = None
+    RANKINGS = ("latest_start", "fewest_days", "least_idle", "most_open_seats")
+    MAX_SAMPLES = 100
+    # the count memo stops growing past this many subproblems
+    MAX_COUNT_MEMO = 500_000
+    # an optional count memo is given up if it has fewer hits than 1/20 of this many subproblems once it has memoized them
+    COUNT_MEMO_PROBE = 1_000
+    BUDGET_SPEC = {
+        "deadline": lambda x: (
+            float(x)
+            if float(x) > 0
+            else raise_(ValueError("Invalid value for budget 'deadline'"))
+        ),
+        "max_nodes": lambda x: (
+            int(x)
+            if int(x) >= 1
+            else raise_(ValueError("Invalid value for budget 'max_nodes'"))
+        ),
+        "max_results": lambda x: (
+            int(x)
+            if int(x) >= 1
+            else raise_(ValueError("Invalid value for budget 'max_results'"))
+        ),
+    }
+    _budget: dict | None = None
+    _deadline: float | None = None
+    search_counters: dict | None = None
+    search_truncated = False
+    search_timings: dict | None = None
+    collect_stats = False
+    # the pairwise constraints, in the order a conflict is attributed to them
+    CONSTRAINTS = ("overlap", "min_interval", "max_interval")
+    PRUNES = CONSTRAINTS + (
+        "consecutive",
+        "campus_days",
+        "one_class_a_day",
+        "wipeout",
+        "bound",
+    )
+    _conflicts: dict[str, list[int]] | None = None
+    _known_pairs: dict | None = None
+    session_status: str | None = None
+    cache_status: str | None = None
     OPTIONS_SPEC = {
         "minimum_start_time": lambda x: datetime.strptime(x, "%H:%M").time(),
         "minimum_interval": lambda x: datetime.combine(
@@ -38,457 +155,2303 @@ class GenerateTimeTableMixin:
         ),
         "allow_one_class_a_day": lambda x: bool(x),
         "allow_only_open_section": lambda x: bool(x),
+        "days_off": lambda x: (
+            [day for day in DAYS if day in x]
+            if isinstance(x, list) and all(day in DAYS for day in x)
+            else raise_(ValueError("Invalid value for option 'days_off'"))
+        ),
+        "max_campus_days": lambda x: (
+            x
+            if x is None
+            or (isinstance(x, int) and not isinstance(x, bool) and 1 <= x <= len(DAYS))
+            else raise_(ValueError("Invalid value for option 'max_campus_days'"))
+        ),
+        # a window of every day that must stay free
+        "lunch": lambda x: None if x is None else to_window(x),
+        # windows of given days that must stay free
+        "blocked": lambda x: (
+            sorted(to_window(window, with_day=True) for window in x)
+            if isinstance(x, list)
+            else raise_(ValueError("Invalid value for option 'blocked'"))
+        ),
+    }
+    # the options that may be left out of a request, and their values then
+    OPTIONS_DEFAULTS = {
+        "days_off": [],
+        "max_campus_days": None,
+        "lunch": None,
+        "blocked": [],
     }
 
     def _generate_timetables(
         self,
-        gr_num: int,
-        timetable: dict[
-            tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]
-        ],
+        remaining: list[int],
+        chosen: dict[int, int],
+        compatibles: int,
+        path: tuple[int] = (),
+        after: tuple[int] | None = None,
     ):
         """
-        Generate timetables with self._groups and self._options
+        Lazily generate timetables with self._groups and self._options, yielding the chosen candidates of each with its
+        search path.
+
+        :param remaining: The indices of the groups to be processed
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        :param path: The candidates chosen so far, in search order
+        :param after: A search path to resume from, the timetables before it are skipped without being searched
+        """
 
-        :param gr_idx: The index of the group to be processed
-        :param timetable: A dictionary that maps timeslots to OpenedSection objects
+        self._spend_node()
+
+        if not remaining:
+            self.search_counters["solutions"] += 1
+            yield path, chosen
+            return
+
+        gr_num = self._most_constrained(remaining, compatibles)
+        rest = [g for g in remaining if g != gr_num]
+
+        domain = compatibles & self._group_masks[gr_num]
+        if after is not None:
+            # candidates are tried in ascending order, so the ones before the resumed path were already searched
+            domain &= ~bit_range(0, after[len(path)])
+
+        for candidate in iter_bits(domain):
+            if not self.insertable(candidate, chosen, compatibles):
+                continue
+
+            # forward checking: give up on the branch as soon as a remaining group has no compatible candidate left
+            new_compatibles = compatibles & self._compatibles[candidate]
+            if self._domain_wiped_out(rest, new_compatibles):
+                self._count_prune("wipeout")
+                continue
+            if self.collect_stats:
+                self._count_conflict_prunes(candidate, compatibles, rest)
+
+            new_chosen = chosen.copy()
+            new_chosen[gr_num] = candidate
+            self._push_day_spans(candidate)
+            try:
+                yield from self._generate_timetables(
+                    rest,
+                    new_chosen,
+                    new_compatibles,
+                    path + (candidate,),
+                    (
+                        after
+                        if after is not None and candidate == after[len(path)]
+                        else None
+                    ),
+                )
+            finally:
+                self._pop_day_spans(candidate)
+
+    def _most_constrained(self, remaining: list[int], compatibles: int):
+        """
+        Returns the remaining group with the fewest compatible candidates left, which the search processes first.
+
+        :param remaining: The indices of the groups to be processed
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        return min(
+            remaining, key=lambda g: (compatibles & self._group_masks[g]).bit_count()
+        )
+
+    def _to_timetable(self, chosen: dict[int, int]):
+        """
+        Map the chosen candidates back to a dictionary of timeslots to OpenedSection objects, in the order of the groups.
+
+        :param chosen: A dictionary that maps the index of each group to its chosen candidate
+        """
+
+        timetable = {}
+        for gr_num in range(len(self._groups)):
+            timeslots = self._candidates[chosen[gr_num]]
+            timetable[timeslots] = self._groups[gr_num][timeslots]
+        return timetable
+
+    def _count_timetables(
+        self,
+        remaining: tuple[int],
+        chosen: dict[int, int],
+        compatibles: int,
+    ):
+        """
+        Count the timetables that complete the chosen candidates, weighting each candidate by its number of
+        OpenedSection objects. Subproblems are memoized by the remaining groups, their compatible candidates, and, when
+        the consecutive class option can reject a timetable, the runs of consecutive classes chosen so far that the
+        remaining groups can still extend, see _consec_state.
+
+        :param remaining: The indices of the groups to be processed
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        self._spend_node()
+
+        if not remaining:
+            self.search_counters["solutions"] += 1
+            return 1
+
+        state = None
+        if self._count_memo is not None:
+            remaining_mask = 0
+            for g in remaining:
+                remaining_mask |= self._group_masks[g]
+            state = (remaining, compatibles & remaining_mask)
+            if self._consec_binding:
+                state += self._consec_state(remaining)
+            if self._days_binding:
+                # the day options only tell days without classes, with one, and with more apart
+                state += tuple(min(classes, 2) for classes in self._day_classes)
+            if state in self._count_memo:
+                self._count_memo_hits += 1
+                return self._count_memo[state]
+
+        gr_num = self._most_constrained(remaining, compatibles)
+        rest = tuple(g for g in remaining if g != gr_num)
+
+        count = 0
+        for candidate in iter_bits(compatibles & self._group_masks[gr_num]):
+            if not self.insertable(candidate, chosen, compatibles):
+                continue
+
+            new_compatibles = compatibles & self._compatibles[candidate]
+            if self._domain_wiped_out(rest, new_compatibles):
+                self._count_prune("wipeout")
+                continue
+            if self.collect_stats:
+                self._count_conflict_prunes(candidate, compatibles, rest)
+
+            new_chosen = chosen.copy()
+            new_chosen[gr_num] = candidate
+            self._push_day_spans(candidate)
+            try:
+                count += self._weights[candidate] * self._count_timetables(
+                    rest, new_chosen, new_compatibles
+                )
+            except SearchBudgetExceeded as e:
+                # pass up what was counted so far, as a lower bound of the count
+                e.partial = count + self._weights[candidate] * e.partial
+                raise
+            finally:
+                self._pop_day_spans(candidate)
+
+        if state is not None and self._count_memo is not None:
+            self._memoize_count(state, count)
+        return count
+
+    def _start_count_memo(self, optional: bool = False):
+        """
+        Start an empty memo for _count_timetables.
+
+        :param optional: Whether the memo may be given up when its subproblems do not repeat, see _memoize_count
+        """
+
+        self._count_memo = {}
+        self._count_memo_hits = 0
+        self._count_memo_optional = optional
+
+    def _memoize_count(self, state: tuple, count: int):
         """
+        Memoize the count of a subproblem, unless MAX_COUNT_MEMO subproblems are memoized already.
+        An optional memo is given up when the consecutive class option is binding and it has barely been hit by the
+        time it has COUNT_MEMO_PROBE subproblems. Its states then include the chosen classes, and when they do not
+        repeat, building them only slows the search down and fills the memory.
 
-        if gr_num == len(self._groups):
-            self.generated_timetables.append(timetable)
+        :param state: The state of the subproblem
+        :param count: The count of the subproblem
+        """
+
+        memo = self._count_memo
+        if len(memo) >= self.MAX_COUNT_MEMO:
             return
 
-        for timeslots in self._groups[gr_num].keys():
-            if self.insertable(timeslots, timetable):
-                new_timetable = timetable.copy()
-                new_timetable[timeslots] = self._groups[gr_num][timeslots]
-                self._generate_timetables(gr_num + 1, new_timetable)
+        memo[state] = count
+        if (
+            self._count_memo_optional
+            and self._consec_binding
+            and len(memo) == self.COUNT_MEMO_PROBE
+            and self._count_memo_hits * 20 < len(memo)
+        ):
+            self._count_memo = None
+
+    def _consec_state(self, remaining: tuple[int]):
+        """
+        Returns the runs of consecutive classes in self._day_spans that a class of the remaining groups could still
+        join, as (day, start minute, end minute, number of classes). The other runs can no longer grow, so they do not
+        change the timetables that complete the chosen classes.
+
+        :param remaining: The indices of the groups to be processed
+        """
+
+        reach = 0
+        for g in remaining:
+            reach |= self._group_reach[g]
+
+        runs = []
+        for day, day_spans in enumerate(self._day_spans):
+            idx = 0
+            while idx < len(day_spans):
+                start, end = day_spans[idx]
+                classes = 1
+                idx += 1
+                while idx < len(day_spans) and day_spans[idx][0] - end <= CONSEC_GAP:
+                    end = day_spans[idx][1]
+                    classes += 1
+                    idx += 1
+                if reach >> (day * REACH_BITS_PER_DAY + start) & bit_range(
+                    0, end - start + 1
+                ):
+                    runs.append((day, start, end, classes))
+
+        return tuple(runs)
+
+    def _domain_wiped_out(self, gr_nums: list[int], compatibles: int):
+        """
+        Returns True if any of the groups has no candidate left in compatibles.
+
+        :param gr_nums: The indices of the groups to check
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        return any(not compatibles & self._group_masks[g] for g in gr_nums)
 
     def insertable(
         self,
-        timeslots: tuple,
-        timetable: dict[
-            tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]
-        ],
+        candidate: int,
+        chosen: dict[int, int],
+        compatibles: int,
     ):
         """
-        Returns True if the timeslots can be inserted into the timetable without conflicts and satisfies the options.
+        Returns True if the candidate can be inserted into the timetable without conflicts and satisfies the options.
 
-        :param timeslots: A tuple of timeslots
-        :param timetable: A dictionary that maps timeslots to OpenedSection objects
+        :param candidate: The index of a candidate timeslots
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
         """
 
-        if timeslots in timetable:
+        if not compatibles >> candidate & 1:
             return False
 
-        for table_timeslots in timetable:
-            if any(
-                [
-                    self._overlap(timeslots, table_timeslots),
-                    self._too_short_interval(timeslots, table_timeslots),
-                    self._too_long_interval(timeslots, table_timeslots),
-                ]
-            ):
-                return False
+        if self._consec_binding and self._too_many_consec_classes(candidate):
+            self._count_prune("consecutive")
+            return False
 
-        if self._too_many_consec_classes(timeslots, timetable.keys()):
+        if self._days_binding and self._breaks_day_options(candidate, chosen):
             return False
 
         return True
 
-    def _overlap(
-        self,
-        timeslots1: tuple[tuple[str, datetime.time, datetime.time]],
-        timeslots2: tuple[tuple[str, datetime.time, datetime.time]],
-    ):
+    def _breaks_day_options(self, candidate: int, chosen: dict[int, int]):
         """
-        Returns True if the two timeslots overlap.
+        Returns True if adding the candidate to the chosen classes in self._day_classes makes the timetable meet on
+        more than max_campus_days days, or, when it completes the timetable, leaves a day with a single class while
+        allow_one_class_a_day is off.
 
-        :param timeslots1: A tuple of timeslots
-        :param timeslots2: A tuple of timeslots
+        :param candidate: The index of a candidate timeslots
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
         """
 
-        for day1, start1, end1 in timeslots1:
-            for day2, start2, end2 in timeslots2:
-                if day1 != day2:
-                    continue
-                if start1 < end2 and start2 < end1:
-                    return True
+        max_campus_days = self._options["max_campus_days"]
+        if (
+            max_campus_days is not None
+            and (self._campus_days | self._candidate_days[candidate]).bit_count()
+            > max_campus_days
+        ):
+            self._count_prune("campus_days")
+            return True
+
+        # a day with a single class can still get another one until the last group
+        if not self._options["allow_one_class_a_day"] and len(chosen) + 1 == len(
+            self._group_candidates
+        ):
+            day_classes = self._day_classes.copy()
+            for day, classes in self._candidate_day_classes[candidate]:
+                day_classes[day] += classes
+            if 1 in day_classes:
+                self._count_prune("one_class_a_day")
+                return True
 
         return False
 
-    def _too_short_interval(
-        self,
-        timeslots1: tuple[tuple[str, datetime.time, datetime.time]],
-        timeslots2: tuple[tuple[str, datetime.time, datetime.time]],
-    ):
+    def _compatible(self, timeslots1: tuple, timeslots2: tuple):
         """
-        Returns True if the interval between the two timeslots is too short.
+        Returns True if the two timeslots can be in the same timetable, regardless of the other timeslots in it.
 
         :param timeslots1: A tuple of timeslots
         :param timeslots2: A tuple of timeslots
         """
 
-        min_interval = self._options["minimum_interval"]
-        if min_interval is None:
-            return False
+        return self._conflict(timeslots1, timeslots2) is None
 
-        for ts1 in timeslots1:
-            for ts2 in timeslots2:
-                day1, start1, _ = ts1
-                day2, start2, _ = ts2
+    def _conflict(self, timeslots1: tuple, timeslots2: tuple):
+        """
+        Returns the first of self.CONSTRAINTS the two timeslots break together, or None if they are compatible.
 
-                if day1 != day2:
-                    continue
+        :param timeslots1: A tuple of timeslots
+        :param timeslots2: A tuple of timeslots
+        """
 
-                before = ts1 if start1 < start2 else ts2
-                after = ts1 if before == ts2 else ts2
+        masks1 = self._timeslot_masks[timeslots1]
+        masks2 = self._timeslot_masks[timeslots2]
+        if timeslots1 == timeslots2 or self._overlap(masks1, masks2):
+            return "overlap"
+        if self._too_short_interval(masks1, masks2):
+            return "min_interval"
+        if self._too_long_interval(masks1, masks2):
+            return "max_interval"
+        return None
+
+    def _overlap(self, masks1: TimeSlotMasks, masks2: TimeSlotMasks):
+        """
+        Returns True if the two timeslots overlap.
 
-                # interval := start time of after - end time of before
-                interval = datetime.combine(
-                    datetime.today(), after[1]
-                ) - datetime.combine(datetime.today(), before[2])
-                if interval < min_interval:
-                    return True
+        :param masks1: The masks of a tuple of timeslots
+        :param masks2: The masks of a tuple of timeslots
+        """
 
-        return False
+        return bool(masks1.occupied & masks2.occupied)
 
-    def _too_long_interval(
-        self,
-        timeslots1: tuple[tuple[str, datetime.time, datetime.time]],
-        timeslots2: tuple[tuple[str, datetime.time, datetime.time]],
-    ):
+    def _too_short_interval(self, masks1: TimeSlotMasks, masks2: TimeSlotMasks):
         """
-        Returns True if the interval between the two timeslots is too long.
+        Returns True if the interval between the two timeslots is too short.
+        The occupied slots of one must not reach into the other's slots padded by the minimum interval.
 
-        :param timeslots1: A tuple of timeslots
-        :param timeslots2: A tuple of timeslots
+        :param masks1: The masks of a tuple of timeslots
+        :param masks2: The masks of a tuple of timeslots
         """
 
-        max_interval = self._options["maximum_interval"]
-        if max_interval is None:
+        if self._options["minimum_interval"] is None:
             return False
 
-        for ts1 in timeslots1:
-            for ts2 in timeslots2:
-                day1, start1, _ = ts1
-                day2, start2, _ = ts2
+        return bool(masks1.padded & masks2.occupied or masks1.occupied & masks2.padded)
 
-                if day1 != day2:
-                    continue
+    def _too_long_interval(self, masks1: TimeSlotMasks, masks2: TimeSlotMasks):
+        """
+        Returns True if the interval between the two timeslots is too long.
+        A class of one must not start too late after, or end too early before, a class of the other on the same day.
 
-                before = ts1 if start1 < start2 else ts2
-                after = ts1 if before == ts2 else ts2
+        :param masks1: The masks of a tuple of timeslots
+        :param masks2: The masks of a tuple of timeslots
+        """
 
-                # interval := start time of after - end time of before
-                interval = datetime.combine(
-                    datetime.today(), after[1]
-                ) - datetime.combine(datetime.today(), before[2])
-                if interval > max_interval:
-                    return True
+        if self._options["maximum_interval"] is None:
+            return False
 
-        return False
+        return bool(masks1.late & masks2.starts or masks1.early & masks2.ends)
 
-    def _too_many_consec_classes(
-        self,
-        timeslots: tuple[tuple[str, datetime.time, datetime.time]],
-        timetable: list[tuple[tuple[str, datetime.time, datetime.time]]],
-    ):
+    def _too_many_consec_classes(self, candidate: int):
         """
-        Returns True if the number of consecutive classes is too many.
+        Returns True if the number of consecutive classes is too many once the candidate is added to the chosen
+        classes in self._day_spans. Only the runs of consecutive classes around the candidate's classes can grow, so
+        only those are counted, from the insertion points of the classes.
 
-        :param timeslots: A tuple of timeslots
-        :param timetable: A list of timeslots
+        :param candidate: The index of a candidate timeslots
         """
-        # days in timeslots := unique days in `timeslots`
-        days_in_timeslots = set([ts[0] for ts in timeslots])
-
-        # flatten timetable timeslot sets to a list s.t. it only has the days in `days_in_timeslots`
-        all_timeslots = [
-            ts for ts_set in timetable for ts in ts_set if ts[0] in days_in_timeslots
-        ]
-
-        # append all elements of `timeslots` to `all_timeslots`
-        all_timeslots.extend(timeslots)
 
-        # split timetable_timeslots by day
-        all_timeslots_by_day: dict[
-            str, list[tuple[str, datetime.time, datetime.time]]
-        ] = {}
-        for ts in all_timeslots:
-            day, _, _ = ts
-            if day not in all_timeslots_by_day:
-                all_timeslots_by_day[day] = []
-            all_timeslots_by_day[day].append(ts)
+        spans = self._timeslot_spans[self._candidates[candidate]]
 
-        # check if there are too many consecutive classes
+        # let consecutive classes be classes with leq CONSEC_GAP minute gap
         allowed_consec_classes = self._options["allow_consec"]
-        for day in days_in_timeslots:
-            # sort a day's timeslots by start time
-            day_timeslots = sorted(all_timeslots_by_day[day], key=lambda x: x[1])
-
-            # count the number of consecutive classes
-            consec_classes = 1
-            for i in range(len(day_timeslots) - 1):
-                _, _, end1 = day_timeslots[i]
-                _, start2, _ = day_timeslots[i + 1]
-
-                # let consecutive classes be classes with leq 15 minute gap
-                # turn time into datetime object to compare
-                start2 = datetime.combine(datetime.min, start2)
-                end1 = datetime.combine(datetime.min, end1)
-
-                if start2 - end1 <= timedelta(minutes=15):
+        self._push_day_spans(candidate)
+        try:
+            for day, start, end in spans:
+                day_spans = self._day_spans[day]
+                idx = bisect_left(day_spans, (start, end))
+
+                consec_classes = 1
+                left = idx
+                while (
+                    left > 0
+                    and day_spans[left][0] - day_spans[left - 1][1] <= CONSEC_GAP
+                ):
                     consec_classes += 1
-                    if consec_classes > allowed_consec_classes:
-                        return True
-                else:
-                    consec_classes = 1
+                    left -= 1
+                right = idx
+                while (
+                    right + 1 < len(day_spans)
+                    and day_spans[right + 1][0] - day_spans[right][1] <= CONSEC_GAP
+                ):
+                    consec_classes += 1
+                    right += 1
+
+                if consec_classes > allowed_consec_classes:
+                    return True
+        finally:
+            self._pop_day_spans(candidate)
 
         return False
 
-    def generate_timetables(self):
+    def _reset_day_spans(self, chosen: dict[int, int]):
         """
-        Generate timetables with self._groups and self._options
+        Reset self._day_spans, the sorted (start minute, end minute) of the chosen classes of each day, to the chosen
+        candidates. The search keeps it up to date by pushing and popping the candidates it tries.
+
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
         """
 
-        if self._groups is None or self._options is None:
+        self._day_spans = [[] for _ in range(len(DAYS))]
+        self._day_classes = [0] * len(DAYS)
+        self._campus_days = 0
+        for candidate in chosen.values():
+            self._push_day_spans(candidate)
+
+    def _push_day_spans(self, candidate: int):
+        """
+        Add the classes of a candidate to self._day_spans, and count them in self._day_classes.
+
+        :param candidate: The index of a candidate timeslots
+        """
+
+        if self._days_binding:
+            for day, classes in self._candidate_day_classes[candidate]:
+                self._day_classes[day] += classes
+            self._campus_days |= self._candidate_days[candidate]
+
+        if not self._consec_binding:
             return
 
-        self.generated_timetables = []
-        self._generate_timetables(0, dict())
+        for day, start, end in self._timeslot_spans[self._candidates[candidate]]:
+            insort(self._day_spans[day], (start, end))
 
-    def exclude_not_opened_sections(self):
+    def _pop_day_spans(self, candidate: int):
         """
-        Exclude all opened sections that are not open.
+        Remove the classes of a candidate, the last pushed, from self._day_spans and self._day_classes.
+
+        :param candidate: The index of a candidate timeslots
         """
 
-        if self._groups is None:
-            return None
+        if self._days_binding:
+            for day, classes in self._candidate_day_classes[candidate]:
+                self._day_classes[day] -= classes
+                if not self._day_classes[day]:
+                    self._campus_days &= ~(1 << day)
 
-        updated_groups = []
-        for group in self._groups:
-            updated_group: dict[
-                tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]
-            ] = {}
-            for timeslots, op_secs in group.items():
-                for op_sec in op_secs:
-                    if op_sec.open_seats > 0:
-                        if timeslots not in updated_group:
-                            updated_group[timeslots] = []
-                        updated_group[timeslots].append(op_sec)
+        if not self._consec_binding:
+            return
+
+        for day, start, end in self._timeslot_spans[self._candidates[candidate]]:
+            day_spans = self._day_spans[day]
+            del day_spans[bisect_left(day_spans, (start, end))]
 
-            updated_groups.append(updated_group)
+    def compile(self):
+        """
+        Compile self._groups for the search, see compile_timeslots and compile_conflicts.
+        """
 
-        self._groups = updated_groups
+        with self._timed("compile"):
+            self.compile_timeslots()
+            self.compile_conflicts()
 
-    def get_timetables_count(self, opened_section_id_groups, options):
+    def compile_timeslots(self):
+        """
+        Compile every timeslot key of self._groups into integer spans and per-day bitmasks, so that the constraints are
+        checked with integer and bitwise operations instead of datetime arithmetic.
         """
-        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return the number of possible timetables.
 
-        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
-        :param options: A dictionary of options
+        if self._groups is None or self._options is None:
+            return
+
+        min_interval = self._options["minimum_interval"]
+        max_interval = self._options["maximum_interval"]
+        min_interval = None if min_interval is None else to_minutes(min_interval)
+        max_interval = None if max_interval is None else to_minutes(max_interval)
+
+        self._timeslot_spans = {
+            timeslots: to_spans(timeslots)
+            for group in self._groups
+            for timeslots in group
+        }
+
+        # the lunch window on every day, and the blocked windows on their day
+        lunch = self._options["lunch"]
+        blocked_spans = to_spans(
+            [(day, *lunch) for day in DAYS] if lunch is not None else []
+        ) + to_spans(self._options["blocked"])
+
+        minutes = [MINUTES_PER_DAY]
+        minutes += [m for m in (min_interval, max_interval) if m is not None]
+        for spans in (*self._timeslot_spans.values(), blocked_spans):
+            for _, start, end in spans:
+                minutes += [start, end]
+        slot_minutes = slot_size(minutes)
+
+        self._timeslot_masks = {
+            timeslots: to_masks(spans, slot_minutes, min_interval, max_interval)
+            for timeslots, spans in self._timeslot_spans.items()
+        }
+        self._blocked_mask = to_masks(blocked_spans, slot_minutes).occupied
+
+    def compile_conflicts(self):
+        """
+        Number every timeslots of self._groups as a candidate, and precompute for each candidate the bitset of
+        candidates of the other groups it is compatible with. The search then checks the pairwise constraints with a
+        single bit lookup instead of re-running them on every recursion node.
         """
-        self.validate_opened_section_id_groups(opened_section_id_groups)
-        self.validate_options(options)
-        self._groups = self.to_timeslot_groups(self._opened_section_id_groups)
 
-        if self._options["allow_only_open_section"] is True:
-            self.exclude_not_opened_sections()
-        if self._options["minimum_start_time"] is not None:
-            self.exclude_early_classes()
+        if self._timeslot_masks is None:
+            return
 
-        self.generate_timetables()
+        self.exclude_blocked_timeslots()
+        self.exclude_settled_conflicts()
+
+        self._candidates = []
+        self._group_candidates = []
+        self._group_masks = []
+        candidate_groups = []
+        for gr_num, group in enumerate(self._groups):
+            first = len(self._candidates)
+            self._candidates.extend(group.keys())
+            self._group_candidates.append(range(first, len(self._candidates)))
+            self._group_masks.append(bit_range(first, len(self._candidates)))
+            candidate_groups.extend([gr_num] * len(group))
+
+        self._compatibles = [0] * len(self._candidates)
+        # with stats, the conflicts are also kept by the constraint they break, to attribute the pruned branches
+        self._conflicts = (
+            {constraint: [0] * len(self._candidates) for constraint in self.CONSTRAINTS}
+            if self.collect_stats
+            else None
+        )
+        if self._known_pairs is not None and self._conflicts is None:
+            self._compile_known_conflicts(candidate_groups)
+        else:
+            for i, timeslots1 in enumerate(self._candidates):
+                for j in range(i + 1, len(self._candidates)):
+                    if candidate_groups[i] == candidate_groups[j]:
+                        continue
+                    constraint = self._conflict(timeslots1, self._candidates[j])
+                    if constraint is None:
+                        self._compatibles[i] |= 1 << j
+                        self._compatibles[j] |= 1 << i
+                    elif self._conflicts is not None:
+                        self._conflicts[constraint][i] |= 1 << j
+                        self._conflicts[constraint][j] |= 1 << i
+
+        self._weights = [
+            len(self._groups[candidate_groups[candidate]][timeslots])
+            for candidate, timeslots in enumerate(self._candidates)
+        ]
 
-        # the number of possible timetables := sum(product(len(op_secs) for timetable in generated_timetables for op_secs in timetable.values()))
-        return sum(
-            reduce(
-                lambda x, y: x * y, [len(op_secs) for op_secs in timetable.values()], 1
+        # the consecutive class option only matters when a day can hold more classes than it allows
+        max_classes_a_day = 0
+        for group in self._groups:
+            max_classes_a_day += max(
+                (
+                    max(Counter(day for day, _, _ in self._timeslot_spans[ts]).values())
+                    for ts in group
+                ),
+                default=0,
             )
-            for timetable in self.generated_timetables
-        )
+        self._consec_binding = max_classes_a_day > self._options["allow_consec"]
+        self.compile_consec_reach()
 
-    def get_timetables(self, opened_section_id_groups, options):
-        """
-        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return a list of possible timetables.
+        self._candidate_day_classes = [
+            tuple(
+                sorted(Counter(day for day, _, _ in self._timeslot_spans[ts]).items())
+            )
+            for ts in self._candidates
+        ]
+        self._candidate_days = [
+            sum(1 << day for day, _ in day_classes)
+            for day_classes in self._candidate_day_classes
+        ]
+        max_campus_days = self._options["max_campus_days"]
+        self._days_binding = (
+            max_campus_days is not None and max_campus_days < len(DAYS)
+        ) or not self._options["allow_one_class_a_day"]
+        self._reset_day_spans({})
 
-        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
-        :param options: A dictionary of options
+    def exclude_blocked_timeslots(self):
+        """
+        Exclude the timeslots of self._groups that meet during the lunch or a blocked window of the options, with a
+        single bitwise check against the windows compiled by compile_timeslots.
+        The groups of fixed sections are kept whatever the options, like in to_timeslot_groups.
         """
-        self.validate_opened_section_id_groups(opened_section_id_groups)
-        self.validate_options(options)
-        self._groups = self.to_timeslot_groups(self._opened_section_id_groups)
-
-        if self._options["allow_only_open_section"] is True:
-            self.exclude_not_opened_sections()
-        if self._options["minimum_start_time"] is not None:
-            self.exclude_early_classes()
 
-        self.generate_timetables()
-        self.realize_timetables()
+        if not self._blocked_mask:
+            return
 
-        return self.realized_timetables
+        fixed = set(self._fixed_sections)
+        self._groups = [
+            (
+                group
+                if fixed
+                and all(
+                    op_sec.id in fixed
+                    for op_secs in group.values()
+                    for op_sec in op_secs
+                )
+                else {
+                    timeslots: op_secs
+                    for timeslots, op_secs in group.items()
+                    if not self._timeslot_masks[timeslots].occupied & self._blocked_mask
+                }
+            )
+            for group in self._groups
+        ]
 
-    def realize_timetables(self):
+    def exclude_settled_conflicts(self):
         """
-        Realize the timetables by picking one OpenedSection from each generated timetables to form a list of timetables that are a list of OpenedSection objects.
+        A group with a single timeslots, e.g. a fixed section, is settled. Exclude the timeslots of the other groups
+        that are not compatible with every settled timeslots, before their pairs are compiled and searched.
         """
 
-        if self.generated_timetables is None:
+        settled = {next(iter(group)) for group in self._groups if len(group) == 1}
+        if not settled:
             return
 
-        self.realized_timetables = []
-        for timetable_idx in range(len(self.generated_timetables)):
-            self._realize_timetables(timetable_idx, 0, [])
+        self._groups = [
+            (
+                group
+                if len(group) == 1
+                else {
+                    timeslots: op_secs
+                    for timeslots, op_secs in group.items()
+                    if all(
+                        self._compatible(timeslots, settled_timeslots)
+                        for settled_timeslots in settled
+                    )
+                }
+            )
+            for group in self._groups
+        ]
 
-    def _realize_timetables(
-        self, timetable_idx: int, gr_idx: int, realization: list[OpenedSection]
-    ):
+    def _compile_known_conflicts(self, candidate_groups: list[int]):
         """
-        Realize the timetables by picking one OpenedSection from each generated timetables to form a list of timetables that are a list of OpenedSection objects.
+        Fill self._compatibles like compile_conflicts, looking the pairs of timeslots up in self._known_pairs before
+        checking them, and replace self._known_pairs with the pairs of the current candidates. The compatibility of two
+        timeslots only depends on the options, so the pairs of a previous compilation with the same options are
+        reused.
 
-        :param timetable_idx: The index of the timetable to be processed
-        :param gr_idx: The index of the group to be processed
-        :param timetable: A list of OpenedSection objects
+        :param candidate_groups: The index of the group of each candidate
         """
-        if gr_idx == len(self.generated_timetables[timetable_idx]):
-            self.realized_timetables.append(realization)
-            return
 
-        timetable = self.generated_timetables[timetable_idx]
-        key = list(timetable.keys())[gr_idx]
-        op_secs = timetable[key]
-        for op_sec in op_secs:
-            new_realization = realization.copy()
-            new_realization.append(op_sec)
-            self._realize_timetables(timetable_idx, gr_idx + 1, new_realization)
+        # number the distinct timeslots, and renumber the known pairs accordingly
+        key_nums = {}
+        for timeslots in self._candidates:
+            key_nums.setdefault(timeslots, len(key_nums))
+        known = [0] * len(key_nums)
+        compatible = [0] * len(key_nums)
+        old_keys = self._known_pairs["keys"]
+        for old_a, timeslots in enumerate(old_keys):
+            a = key_nums.get(timeslots)
+            if a is None:
+                continue
+            for old_b in iter_bits(self._known_pairs["known"][old_a]):
+                b = key_nums.get(old_keys[old_b])
+                if b is None:
+                    continue
+                known[a] |= 1 << b
+                if self._known_pairs["compatible"][old_a] >> old_b & 1:
+                    compatible[a] |= 1 << b
+
+        nums = [key_nums[timeslots] for timeslots in self._candidates]
+        for i, timeslots1 in enumerate(self._candidates):
+            a = nums[i]
+            for j in range(i + 1, len(self._candidates)):
+                if candidate_groups[i] == candidate_groups[j]:
+                    continue
+                b = nums[j]
+                if not known[a] >> b & 1:
+                    known[a] |= 1 << b
+                    known[b] |= 1 << a
+                    if self._compatible(timeslots1, self._candidates[j]):
+                        compatible[a] |= 1 << b
+                        compatible[b] |= 1 << a
+                if compatible[a] >> b & 1:
+                    self._compatibles[i] |= 1 << j
+                    self._compatibles[j] |= 1 << i
+
+        self._known_pairs = {
+            "keys": list(key_nums),
+            "known": known,
+            "compatible": compatible,
+        }
 
-    def exclude_not_opened_sections(self):
+    def generate_timetables(self):
         """
-        Exclude all opened sections that do not have seats available.
+        Generate timetables with self._groups and self._options
         """
 
-        if self._groups is None:
-            return None
+        if self._groups is None or self._options is None:
+            return
 
-        updated_groups = {}
-        for timeslots, op_secs in self._groups.items():
-            updated_groups[timeslots] = [
-                op_sec
-                for op_sec in op_secs
-                if (op_sec is not None and op_sec.open_seats > 0)
-            ]
+        if self._workers:
+            with self._timed("search"):
+                self.generated_timetables = self._generate_in_parallel()
+            return
 
-        self._groups = updated_groups
+        self.generated_timetables = [
+            timetable for _, timetable in self.iter_generated_timetables()
+        ]
 
-    def exclude_early_classes(self):
+    def iter_generated_timetables(self, after: tuple[int] | None = None):
         """
-        Exclude all opened sections that start before min_start_time.
+        Lazily generate timetables with self._groups and self._options, one at a time with its search path.
 
-        :param min_start_time: A datetime.time object
+        :param after: A search path to resume from
         """
 
-        if self._groups is None:
-            return None
-
-        min_start_time = self._options["minimum_start_time"]
-        updated_groups = []
-        for group in self._groups:
-            updated_group: dict[
-                tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]
-            ] = {}
-            for timeslots in group:
-                for _, start_time, _ in timeslots:
-                    if start_time >= min_start_time:  # not early class
-                        updated_group[timeslots] = group[timeslots]
-            updated_groups.append(updated_group)
+        if self._groups is None or self._options is None:
+            return
 
-        self._groups = updated_groups
+        self.compile()
+        self._start_budget()
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = list(range(len(self._groups)))
+        if self._domain_wiped_out(remaining, compatibles):
+            return
 
-    def validate_opened_section_id_groups(self, opened_section_id_groups):
+        # the search is timed while it runs, not while the caller consumes the timetables
+        started = perf_counter()
+        try:
+            for path, chosen in self._generate_timetables(
+                remaining, dict(), compatibles, (), after
+            ):
+                timetable = self._to_timetable(chosen)
+                self._add_timing("search", perf_counter() - started)
+                yield path, timetable
+                started = perf_counter()
+        except SearchBudgetExceeded:
+            self.search_truncated = True
+        self._add_timing("search", perf_counter() - started)
+
+    def set_workers(self, parallel: bool = False):
         """
-        Given a list of OpenedSection queryset objects(group), validate if the groups are valid.
+        Run the following searches on settings.WIZARD_PARALLEL_WORKERS processes if parallel is True and the setting
+        is more than 1, and in this process otherwise.
 
-        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param parallel: Whether the search may run in parallel
         """
 
-        if not all(isinstance(group, list) for group in opened_section_id_groups):
-            raise ValueError("Invalid groups")
+        workers = getattr(settings, "WIZARD_PARALLEL_WORKERS", None)
+        self._workers = workers if parallel and workers and workers > 1 else None
 
-        for group in opened_section_id_groups:
-            if not all(isinstance(id_, int) for id_ in group):
-                raise ValueError("Invalid section ID")
+    def export_problem(self):
+        """
+        Returns the compiled search problem in a compact picklable form, made of integer timeslots and candidate
+        indices only, so that it can be solved in another process with load_problem.
+        """
 
-        self._opened_section_id_groups = opened_section_id_groups
+        return {
+            "candidates": [self._timeslot_spans[ts] for ts in self._candidates],
+            "group_candidates": [(r.start, r.stop) for r in self._group_candidates],
+            "group_masks": self._group_masks,
+            "compatibles": self._compatibles,
+            "weights": self._weights,
+            "consec_binding": self._consec_binding,
+            "allow_consec": self._options["allow_consec"],
+            "days_binding": self._days_binding,
+            "candidate_day_classes": self._candidate_day_classes,
+            "allow_one_class_a_day": self._options["allow_one_class_a_day"],
+            "max_campus_days": self._options["max_campus_days"],
+            "conflicts": self._conflicts,
+        }
+
+    def load_problem(self, problem: dict):
+        """
+        Load a search problem made by export_problem. The timeslots of the loaded candidates are their integer spans.
 
-    def validate_options(self, options: dict):
+        :param problem: A dictionary made by export_problem
         """
-        Given a dictionary of options, validate if the options are valid.
 
-        :param options: A dictionary of options
+        self._candidates = problem["candidates"]
+        self._timeslot_spans = {spans: spans for spans in self._candidates}
+        self._group_candidates = [
+            range(start, stop) for start, stop in problem["group_candidates"]
+        ]
+        self._group_masks = problem["group_masks"]
+        self._compatibles = problem["compatibles"]
+        self._weights = problem["weights"]
+        self._consec_binding = problem["consec_binding"]
+        self.compile_consec_reach()
+        self._days_binding = problem["days_binding"]
+        self._candidate_day_classes = problem["candidate_day_classes"]
+        self._candidate_days = [
+            sum(1 << day for day, _ in day_classes)
+            for day_classes in self._candidate_day_classes
+        ]
+        self._options = {
+            "allow_consec": problem["allow_consec"],
+            "allow_one_class_a_day": problem["allow_one_class_a_day"],
+            "max_campus_days": problem["max_campus_days"],
+        }
+        self._conflicts = problem["conflicts"]
+        self.collect_stats = self._conflicts is not None
+
+    def _split_search(self, remaining: list[int], compatibles: int):
         """
-        validated_options = {}
+        Expand the first one or two levels of the search into independent subproblems, enough to keep the workers
+        busy. Returns a list of (remaining, chosen, compatibles, path) in search order.
 
-        for opt, validate in self.OPTIONS_SPEC.items():
-            if opt not in options:
-                raise ValueError(f"Missing option '{opt}'")
+        :param remaining: The indices of the groups to be processed
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
 
-            try:
-                validated_options[opt] = validate(options[opt])
-            except (ValueError, TypeError):
-                raise ValueError(f"Invalid value for option '{opt}'")
+        subproblems = [(remaining, dict(), compatibles, ())]
+        for _ in range(2):
+            if len(subproblems) >= 4 * self._workers:
+                break
 
-        self._options = validated_options
+            expanded = []
+            for remaining, chosen, compatibles, path in subproblems:
+                if not remaining:
+                    expanded.append((remaining, chosen, compatibles, path))
+                    continue
+
+                self._spend_node()
+                self._reset_day_spans(chosen)
+                gr_num = self._most_constrained(remaining, compatibles)
+                rest = tuple(g for g in remaining if g != gr_num)
+                for candidate in iter_bits(compatibles & self._group_masks[gr_num]):
+                    if not self.insertable(candidate, chosen, compatibles):
+                        continue
+                    new_compatibles = compatibles & self._compatibles[candidate]
+                    if self._domain_wiped_out(rest, new_compatibles):
+                        self._count_prune("wipeout")
+                        continue
+                    if self.collect_stats:
+                        self._count_conflict_prunes(candidate, compatibles, rest)
+                    new_chosen = chosen.copy()
+                    new_chosen[gr_num] = candidate
+                    expanded.append(
+                        (rest, new_chosen, new_compatibles, path + (candidate,))
+                    )
+            subproblems = expanded
 
-    def to_timeslot_groups(self, opened_section_id_groups: list[list[int]]):
+        return subproblems
+
+    def _solve_in_parallel(self, mode: str, subproblems: list[tuple]):
         """
-        Given a list of OpenedSection queryset objects(group), convert to a dict that maps timeslots to OpenedSection objects.
-        Cache the results in self._groups
+        Solve the subproblems on the process pool, and merge the search counters of the workers. Returns the results
+        in the order of the subproblems.
 
-        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param mode: "count" or "generate"
+        :param subproblems: A list made by _split_search
         """
 
-        # convert to a dict that maps timeslots to OpenedSection objects
-        groups = []
-        for opened_section_id_group in opened_section_id_groups:
-            group: dict[tuple, list[OpenedSection]] = {}
-            queryset = OpenedSection.objects.filter(id__in=opened_section_id_group)
+        problem = self.export_problem()
+        budget = dict(self._budget)
+        if self._deadline is not None:
+            budget["deadline"] = max(self._deadline - monotonic(), 0.001)
+        budgets = [budget] * len(subproblems)
+        if budget["max_nodes"] is not None and subproblems:
+            # the node budget is the request's, so the nodes left after the split are divided among the subproblems
+            left = max(budget["max_nodes"] - self.search_counters["nodes"], 0)
+            share, extra = divmod(left, len(subproblems))
+            budgets = [
+                {**budget, "max_nodes": share + (idx < extra)}
+                for idx in range(len(subproblems))
+            ]
 
-            # prefetch related fields required in response
-            queryset = queryset.prefetch_related(
-                Prefetch(
-                    lookup="meeting_set",
-                    queryset=Meeting.objects.select_related(
-                        "duration", "day", "location", "location__building"
-                    ),
-                ),
-                Prefetch(
-                    lookup="teach_set",
-                    queryset=Teach.objects.select_related("instructor"),
-                ),
-            )
-            queryset = queryset.select_related("section__course")
+        pool = get_process_pool(self._workers)
+        futures = [
+            pool.submit(solve_subproblem, problem, subproblem, mode, subproblem_budget)
+            for subproblem, subproblem_budget in zip(subproblems, budgets)
+        ]
 
-            # filter out sections that have no meetings
-            queryset = queryset.annotate(
-                has_meetings=Exists(
-                    Meeting.objects.filter(opened_section=OuterRef("pk"))
-                )
-            ).filter(has_meetings=True)
+        results = []
+        for future in futures:
+            result, counters, truncated = future.result()
+            self.search_counters["nodes"] += counters["nodes"]
+            self.search_counters["solutions"] += counters["solutions"]
+            if self.collect_stats:
+                for reason, pruned in counters["pruned"].items():
+                    self.search_counters["pruned"][reason] += pruned
+            self.search_truncated = self.search_truncated or truncated
+            results.append(result)
+        return results
+
+    def _count_in_parallel(self, remaining: tuple[int], compatibles: int):
+        """
+        Count the timetables by splitting the search into subproblems counted on the process pool.
 
-            for op_sec in queryset:
-                timeslots = (
-                    Meeting.objects.filter(opened_section=op_sec)
-                    .values_list(
-                        "day__day", "duration__start_time", "duration__end_time"
-                    )
-                    .distinct()
-                )
-                timeslots = tuple(sorted(list(timeslots)))
+        :param remaining: The indices of the groups to be processed
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        try:
+            subproblems = self._split_search(remaining, compatibles)
+        except SearchBudgetExceeded:
+            self.search_truncated = True
+            return 0
+
+        counts = self._solve_in_parallel("count", subproblems)
+        total = 0
+        for (_, chosen, _, _), count in zip(subproblems, counts):
+            for candidate in chosen.values():
+                count *= self._weights[candidate]
+            total += count
+        return total
+
+    def _generate_in_parallel(self):
+        """
+        Generate timetables by splitting the search into subproblems generated on the process pool.
+        """
+
+        self.compile()
+        self._start_budget()
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = tuple(range(len(self._groups)))
+        if self._domain_wiped_out(remaining, compatibles):
+            return []
+
+        try:
+            subproblems = self._split_search(remaining, compatibles)
+        except SearchBudgetExceeded:
+            self.search_truncated = True
+            return []
+
+        return [
+            self._to_timetable(chosen)
+            for solutions in self._solve_in_parallel("generate", subproblems)
+            for chosen in solutions
+        ]
+
+    def _rank_timetables(
+        self,
+        remaining: list[int],
+        chosen: dict[int, int],
+        compatibles: int,
+    ):
+        """
+        Branch and bound search for the self._rank_size best timetables by self._rank_by, kept in self._ranked.
+
+        :param remaining: The indices of the groups to be processed
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        self._spend_node()
+
+        # prune the branch if even its best completion cannot beat the current k-th best timetable
+        bound = self._cost_bound(remaining, chosen, compatibles)
+        if len(self._ranked) == self._rank_size and bound >= -self._ranked[0][0]:
+            self._count_prune("bound")
+            return
+
+        if not remaining:
+            self.search_counters["solutions"] += 1
+            self._rank_realizations(chosen, bound)
+            return
+
+        gr_num = self._most_constrained(remaining, compatibles)
+        rest = [g for g in remaining if g != gr_num]
+
+        # try the candidates that look best first, so that good timetables are found early and prune more
+        domain = sorted(
+            iter_bits(compatibles & self._group_masks[gr_num]),
+            key=lambda c: self._candidate_costs[c],
+        )
+        for candidate in domain:
+            if not self.insertable(candidate, chosen, compatibles):
+                continue
+
+            new_compatibles = compatibles & self._compatibles[candidate]
+            if self._domain_wiped_out(rest, new_compatibles):
+                self._count_prune("wipeout")
+                continue
+            if self.collect_stats:
+                self._count_conflict_prunes(candidate, compatibles, rest)
+
+            new_chosen = chosen.copy()
+            new_chosen[gr_num] = candidate
+            self._push_day_spans(candidate)
+            try:
+                self._rank_timetables(rest, new_chosen, new_compatibles)
+            finally:
+                self._pop_day_spans(candidate)
+
+    def _cost_bound(
+        self,
+        remaining: list[int],
+        chosen: dict[int, int],
+        compatibles: int,
+    ):
+        """
+        Returns a lower bound of the cost of any realized timetable that completes the chosen candidates. Lower costs
+        rank higher. When no group remains, the bound is the cost of the best realization of the timetable.
+
+        :param remaining: The indices of the groups to be processed
+        :param chosen: A dictionary that maps the index of each processed group to its chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        """
+
+        domains = [
+            list(iter_bits(compatibles & self._group_masks[g])) for g in remaining
+        ]
+
+        if self._rank_by == "latest_start":
+            # the earliest class can only get earlier, at best to the latest first class each group can offer
+            starts = [self._first_starts[c] for c in chosen.values()]
+            starts += [max(self._first_starts[c] for c in domain) for domain in domains]
+            return -min(starts, default=0)
+
+        if self._rank_by == "fewest_days":
+            # each group needs at least its fewest new days, and they may all fall on the same days
+            days = 0
+            for c in chosen.values():
+                days |= self._day_bits[c]
+            new_days = [
+                min((self._day_bits[c] & ~days).bit_count() for c in domain)
+                for domain in domains
+            ]
+            return days.bit_count() + max(new_days, default=0)
+
+        if self._rank_by == "least_idle":
+            # a class can at best fill idle time as long as itself
+            spans = [
+                span
+                for c in chosen.values()
+                for span in self._timeslot_spans[self._candidates[c]]
+            ]
+            fillable = sum(
+                max(self._class_minutes[c] for c in domain) for domain in domains
+            )
+            return max(idle_minutes(spans) - fillable, 0)
+
+        # most_open_seats: every group picks its section with the most open seats
+        seats = sum(self._best_open_seats[c] for c in chosen.values())
+        seats += sum(
+            max(self._best_open_seats[c] for c in domain) for domain in domains
+        )
+        return -seats
+
+    def _rank_realizations(self, chosen: dict[int, int], best_cost: int):
+        """
+        Push the best realizations of a generated timetable into self._ranked, in ascending order of cost, until they
+        can no longer beat the k-th best timetable.
+
+        :param chosen: A dictionary that maps the index of each group to its chosen candidate
+        :param best_cost: The cost of the best realization of the timetable
+        """
+
+        op_secs_list = [
+            self._ranked_op_secs(gr_num, chosen[gr_num])
+            for gr_num in range(len(self._groups))
+        ]
+        costs = [
+            [
+                -(op_sec.open_seats or 0) if self._rank_by == "most_open_seats" else 0
+                for op_sec in op_secs
+            ]
+            for op_secs in op_secs_list
+        ]
+        # the section costs are already counted in best_cost
+        timetable_cost = best_cost - sum(c[0] for c in costs)
+
+        for cost, positions in iter_best_positions(costs):
+            cost += timetable_cost
+            if len(self._ranked) == self._rank_size and cost >= -self._ranked[0][0]:
+                return
+
+            self._rank_seq += 1
+            realization = [
+                op_secs[position] for op_secs, position in zip(op_secs_list, positions)
+            ]
+            # max heap on (cost, seq), so that the worst and latest found timetable is evicted first
+            entry = (-cost, -self._rank_seq, realization)
+            if len(self._ranked) == self._rank_size:
+                heapq.heapreplace(self._ranked, entry)
+            else:
+                heapq.heappush(self._ranked, entry)
+
+    def _ranked_op_secs(self, gr_num: int, candidate: int):
+        """
+        Returns the OpenedSection objects of a candidate, the ones with the most open seats first when ranking by them.
+
+        :param gr_num: The index of the group of the candidate
+        :param candidate: The index of the candidate
+        """
+
+        op_secs = self._groups[gr_num][self._candidates[candidate]]
+        if self._rank_by == "most_open_seats":
+            op_secs = sorted(op_secs, key=lambda op_sec: -(op_sec.open_seats or 0))
+        return op_secs
+
+    def rank_timetables(self, rank_by: str, k: int):
+        """
+        Find the k best realized timetables with self._groups and self._options by a ranking, without generating all
+        of them. Returns a list of lists of OpenedSection objects, best first.
+
+        :param rank_by: One of RANKINGS
+        :param k: The number of timetables to return
+        """
+
+        if self._groups is None or self._options is None:
+            return []
+
+        self.compile()
+
+        self._rank_by = rank_by
+        self._rank_size = k
+        self._rank_seq = 0
+        self._ranked = []
+
+        self._first_starts = []
+        self._day_bits = []
+        self._class_minutes = []
+        self._best_open_seats = []
+        for gr_num, candidates in enumerate(self._group_candidates):
+            for candidate in candidates:
+                timeslots = self._candidates[candidate]
+                spans = self._timeslot_spans[timeslots]
+                self._first_starts.append(min(start for _, start, _ in spans))
+                self._day_bits.append(sum(set(1 << day for day, _, _ in spans)))
+                self._class_minutes.append(sum(end - start for _, start, end in spans))
+                self._best_open_seats.append(
+                    max(
+                        op_sec.open_seats or 0
+                        for op_sec in self._groups[gr_num][timeslots]
+                    )
+                )
+
+        self._candidate_costs = {
+            "latest_start": [-start for start in self._first_starts],
+            "fewest_days": [days.bit_count() for days in self._day_bits],
+            "least_idle": [0] * len(self._candidates),
+            "most_open_seats": [-seats for seats in self._best_open_seats],
+        }[rank_by]
+
+        self._start_budget()
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = list(range(len(self._groups)))
+        if not self._domain_wiped_out(remaining, compatibles):
+            try:
+                with self._timed("search"):
+                    self._rank_timetables(remaining, dict(), compatibles)
+            except SearchBudgetExceeded:
+                self.search_truncated = True
+
+        return [realization for _, _, realization in sorted(self._ranked, reverse=True)]
+
+    def sample_timetables(self, n: int, rng: random.Random):
+        """
+        Draw n distinct realized timetables with self._groups and self._options uniformly at random, or all of them in
+        random order if there are at most n. Returns a list of lists of OpenedSection objects.
+
+        :param n: The number of timetables to draw
+        :param rng: The random number generator
+        """
+
+        if self._groups is None or self._options is None:
+            return []
+
+        self.compile()
+
+        self._start_count_memo()
+        self._start_budget()
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = tuple(range(len(self._groups)))
+        if self._domain_wiped_out(remaining, compatibles):
+            return []
+
+        samples = []
+        try:
+            with self._timed("search"):
+                total = self._count_timetables(remaining, dict(), compatibles)
+                if total <= n:
+                    samples = [
+                        realization
+                        for _, chosen in self._generate_timetables(
+                            list(remaining), dict(), compatibles
+                        )
+                        for _, realization in self._realize_timetables(
+                            self._to_timetable(chosen)
+                        )
+                    ]
+                    rng.shuffle(samples)
+                else:
+                    # redraw the timetables drawn before, which is rare when n is small next to the total
+                    drawn = set()
+                    while len(samples) < n:
+                        realization = self._sample_timetable(
+                            remaining, compatibles, rng
+                        )
+                        ids = tuple(op_sec.id for op_sec in realization)
+                        if ids not in drawn:
+                            drawn.add(ids)
+                            samples.append(realization)
+        except SearchBudgetExceeded:
+            self.search_truncated = True
+        self.search_counters["results"] = len(samples)
+
+        return samples
+
+    def _sample_timetable(
+        self, remaining: tuple[int], compatibles: int, rng: random.Random
+    ):
+        """
+        Draw a realized timetable uniformly at random. Each group picks a candidate with a probability proportional
+        to the number of realized timetables that complete it, counted by _count_timetables, then each candidate picks
+        one of its OpenedSection objects.
+
+        :param remaining: The indices of the groups to be processed
+        :param compatibles: A bitset of the candidates compatible with every chosen candidate
+        :param rng: The random number generator
+        """
+
+        chosen = {}
+        try:
+            while remaining:
+                gr_num = self._most_constrained(remaining, compatibles)
+                rest = tuple(g for g in remaining if g != gr_num)
+
+                branches = []
+                for candidate in iter_bits(compatibles & self._group_masks[gr_num]):
+                    if not self.insertable(candidate, chosen, compatibles):
+                        continue
+                    new_compatibles = compatibles & self._compatibles[candidate]
+                    if self._domain_wiped_out(rest, new_compatibles):
+                        continue
+                    self._push_day_spans(candidate)
+                    try:
+                        count = self._count_timetables(
+                            rest, {**chosen, gr_num: candidate}, new_compatibles
+                        )
+                    finally:
+                        self._pop_day_spans(candidate)
+                    branches.append(
+                        (candidate, new_compatibles, self._weights[candidate] * count)
+                    )
+
+                pick = rng.randrange(sum(weight for _, _, weight in branches))
+                for candidate, new_compatibles, weight in branches:
+                    if pick < weight:
+                        break
+                    pick -= weight
+
+                chosen[gr_num] = candidate
+                self._push_day_spans(candidate)
+                remaining, compatibles = rest, new_compatibles
+        finally:
+            for candidate in chosen.values():
+                self._pop_day_spans(candidate)
+
+        return [
+            rng.choice(self._groups[gr_num][self._candidates[chosen[gr_num]]])
+            for gr_num in range(len(self._groups))
+        ]
+
+    def set_budget(self, budget: dict | None = None, caps: dict | None = None):
+        """
+        Given a dictionary of per-request search limits, validate them and combine them with the server-wide caps in
+        settings.WIZARD_SEARCH_LIMITS. The stricter of the two applies.
+
+        :param budget: A dictionary with optional "deadline" in seconds, "max_nodes" and "max_results"
+        :param caps: Caps to use instead of settings.WIZARD_SEARCH_LIMITS
+        """
+
+        if budget is not None and not isinstance(budget, dict):
+            raise ValueError("Invalid budget")
+
+        if caps is None:
+            caps = getattr(settings, "WIZARD_SEARCH_LIMITS", {})
+        validated_budget = {}
+        for name, validate in self.BUDGET_SPEC.items():
+            value = None
+            if budget is not None and budget.get(name) is not None:
+                try:
+                    value = validate(budget[name])
+                except (ValueError, TypeError):
+                    raise ValueError(f"Invalid value for budget '{name}'")
+
+            cap = caps.get(name.upper())
+            if cap is not None:
+                value = cap if value is None else min(value, cap)
+            validated_budget[name] = value
+
+        self._budget = validated_budget
+
+    def _start_budget(self):
+        """
+        Reset the search counters and start the clock of the deadline.
+        """
+
+        if self._budget is None:
+            self.set_budget()
+
+        self.search_truncated = False
+        self.search_counters = {
+            "nodes": 0,
+            "results": 0,
+            "solutions": 0,
+            "started": monotonic(),
+        }
+        if self.collect_stats:
+            self.search_counters["pruned"] = dict.fromkeys(self.PRUNES, 0)
+        deadline = self._budget["deadline"]
+        self._deadline = None if deadline is None else monotonic() + deadline
+
+    def _spend_node(self):
+        """
+        Count a visited search node, and raise SearchBudgetExceeded if the node budget or the deadline is used up.
+        """
+
+        self.search_counters["nodes"] += 1
+        nodes = self.search_counters["nodes"]
+        max_nodes = self._budget["max_nodes"]
+        if max_nodes is not None and nodes > max_nodes:
+            raise SearchBudgetExceeded()
+        # reading the clock is cheap, but not free
+        if (
+            self._deadline is not None
+            and nodes % 64 == 0
+            and monotonic() > self._deadline
+        ):
+            raise SearchBudgetExceeded()
+
+    def _count_prune(self, reason: str):
+        """
+        Count a branch pruned for a reason of self.PRUNES, if stats are collected.
+        """
+
+        if self.collect_stats:
+            self.search_counters["pruned"][reason] += 1
+
+    def _count_conflict_prunes(self, candidate: int, compatibles: int, rest: list[int]):
+        """
+        Count the candidates of the remaining groups that choosing a candidate rules out, by the constraint they break
+        with it.
+
+        :param candidate: The index of the chosen candidate
+        :param compatibles: A bitset of the candidates compatible with every candidate chosen before it
+        :param rest: The indices of the groups left to be processed
+        """
+
+        rest_mask = 0
+        for g in rest:
+            rest_mask |= self._group_masks[g]
+        ruled_out = compatibles & rest_mask & ~self._compatibles[candidate]
+        pruned = self.search_counters["pruned"]
+        for constraint in self.CONSTRAINTS:
+            pruned[constraint] += (
+                ruled_out & self._conflicts[constraint][candidate]
+            ).bit_count()
+
+    @contextmanager
+    def _timed(self, phase: str):
+        """
+        Add the time spent in the block to self.search_timings[phase].
+        """
+
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self._add_timing(phase, perf_counter() - started)
+
+    def _add_timing(self, phase: str, seconds: float):
+        """
+        Add seconds to self.search_timings[phase].
+        """
+
+        if self.search_timings is None:
+            self.search_timings = {}
+        self.search_timings[phase] = self.search_timings.get(phase, 0) + seconds
+
+    def set_stats(self, enabled: bool = False):
+        """
+        Collect the branches pruned by each constraint in the following searches, at some cost in speed, and report
+        them with the phase timings in search_report.
+
+        :param enabled: Whether to collect the stats
+        """
+
+        self.collect_stats = enabled
+
+    def _limit_results(self, timetables):
+        """
+        Pass the timetables through until the result budget is used up.
+
+        :param timetables: An iterable of timetables
+        """
+
+        max_results = self._budget["max_results"] if self._budget else None
+        timetables = iter(timetables)
+        for timetable in timetables:
+            if (
+                max_results is not None
+                and self.search_counters["results"] == max_results
+            ):
+                self.search_truncated = True
+                return
+            self.search_counters["results"] += 1
+            yield timetable
+
+    def search_report(self):
+        """
+        Returns whether the last search was cut short by its budget, and the counters it reached.
+        """
+
+        counters = self.search_counters or {"nodes": 0, "results": 0}
+        report = {
+            "truncated": self.search_truncated,
+            "counters": {
+                "nodes": counters["nodes"],
+                "results": counters["results"],
+                "seconds": (
+                    round(monotonic() - counters["started"], 3)
+                    if "started" in counters
+                    else 0
+                ),
+            },
+        }
+        if self.collect_stats:
+            report["stats"] = self.search_stats()
+
+        return report
+
+    def search_stats(self):
+        """
+        Returns the solutions found by the last search, the branches it pruned by each reason of self.PRUNES if stats
+        are collected, and the seconds spent in each phase of the request.
+        """
+
+        counters = self.search_counters or {}
+        return {
+            "solutions": counters.get("solutions", 0),
+            "pruned": counters.get("pruned"),
+            "timings": {
+                phase: round(seconds, 4)
+                for phase, seconds in (self.search_timings or {}).items()
+            },
+        }
+
+    def log_search(self, kind: str):
+        """
+        Log the groups, options and outcome of the last search as a JSON line, for analysis.
+
+        :param kind: What was searched, e.g. "timetables" or "count"
+        """
+
+        logger.info(
+            "wizard_search %s",
+            json.dumps(
+                {
+                    "kind": kind,
+                    "groups": [
+                        len(group) for group in self._opened_section_id_groups or []
+                    ],
+                    "options": self._options,
+                    "cache": self.cache_status,
+                    **self.search_report(),
+                    **({} if self.collect_stats else {"stats": self.search_stats()}),
+                },
+                default=str,
+            ),
+        )
+
+    def count_timetables(self):
+        """
+        Count the timetables with self._groups and self._options without generating them.
+        """
+
+        if self._groups is None or self._options is None:
+            return 0
+
+        self.compile()
+
+        self._start_count_memo(optional=True)
+        self._start_budget()
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = tuple(range(len(self._groups)))
+        if self._domain_wiped_out(remaining, compatibles):
+            return 0
+
+        with self._timed("search"):
+            if self._workers:
+                return self._count_in_parallel(remaining, compatibles)
+
+            try:
+                return self._count_timetables(remaining, dict(), compatibles)
+            except SearchBudgetExceeded as e:
+                self.search_truncated = True
+                return e.partial
+
+    def compile_consec_reach(self):
+        """
+        When the consecutive class option is binding, compile for each group the minutes of the week its classes can
+        be consecutive with: the minutes of its candidates' classes, widened by CONSEC_GAP minutes on both sides.
+        """
+
+        if not self._consec_binding:
+            self._group_reach = None
+            return
+
+        self._group_reach = []
+        for candidates in self._group_candidates:
+            reach = 0
+            for candidate in candidates:
+                for day, start, end in self._timeslot_spans[
+                    self._candidates[candidate]
+                ]:
+                    offset = day * REACH_BITS_PER_DAY
+                    reach |= bit_range(
+                        offset + max(start - CONSEC_GAP, 0),
+                        offset + end + CONSEC_GAP + 1,
+                    )
+            self._group_reach.append(reach)
+
+    def with_fixed_sections(self, opened_section_id_groups, fixed):
+        """
+        Returns the groups preceded by a group of its own for each fixed section, so that every timetable has the
+        fixed sections first. The search settles them up front, see exclude_settled_conflicts.
+        The fixed sections are loaded whatever the options, as a student is often already in a section that is full.
+        The ones without meetings do not conflict with anything, and are left out.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param fixed: A list of OpenedSection queryset objects' ids, or None
+        """
+
+        self._fixed_sections = ()
+        if fixed is None:
+            return opened_section_id_groups
+
+        if not isinstance(opened_section_id_groups, list):
+            raise ValueError("Invalid groups")
+        if not isinstance(fixed, list) or not all(
+            isinstance(id_, int) and not isinstance(id_, bool) for id_ in fixed
+        ):
+            raise ValueError("Invalid fixed sections")
+
+        with_meetings = set(
+            Meeting.objects.filter(opened_section_id__in=fixed).values_list(
+                "opened_section_id", flat=True
+            )
+        )
+        fixed = [id_ for id_ in dict.fromkeys(fixed) if id_ in with_meetings]
+        self._fixed_sections = tuple(sorted(fixed))
+
+        return [[id_] for id_ in fixed] + opened_section_id_groups
+
+    def get_timetables_count(self, opened_section_id_groups, options):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return the number of possible timetables.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        """
+        key = self._cache_key("count", opened_section_id_groups, options)
+        # the stats describe a search, so a request for them is searched even if its result is cached
+        count = None if self.collect_stats else get_result(key)
+        if count is not None:
+            self.cache_status = "hit"
+            self.search_timings = {}
+            self._start_budget()
+            return count
+
+        self.cache_status = "miss"
+        # counting only needs the timeslots of the sections
+        self.prepare_groups(opened_section_id_groups, options, prefetch=False)
+        count = self.count_timetables()
+        if not self.search_truncated:
+            set_result(key, count, 1)
+
+        return count
+
+    def get_timetables_count_in_session(
+        self, opened_section_id_groups, options, token: str | None = None
+    ):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return the number of
+        possible timetables and the token of the session. The session keeps the compiled pairs of timeslots and the
+        timetables of the request, so that the next request of the session only checks the pairs of timeslots it did
+        not have, and when it adds a single group, extends the timetables instead of searching them again.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        :param token: The token of the session, or None to start one
+        """
+        if token is None:
+            token = uuid.uuid4().hex
+        elif not isinstance(token, str) or not re.fullmatch(r"[0-9a-f]{32}", token):
+            raise ValueError("Invalid session")
+
+        self.validate_opened_section_id_groups(opened_section_id_groups)
+        self.validate_options(options)
+        groups = canonical_groups(opened_section_id_groups)
+        version = self._data_version(groups)
+
+        state = get_session(token)
+        if state is not None and (
+            state["options"] != self._options
+            or state["version"] != version
+            or state.get("fixed") != self._fixed_sections
+        ):
+            state = None
+
+        self.prepare_groups(groups, options, prefetch=False)
+        self._known_pairs = (
+            state["pairs"] if state else {"keys": [], "known": [], "compatible": []}
+        )
+        self.compile()
+        self._start_budget()
+
+        added, solutions = None, None
+        if state is not None and state["solutions"] is not None:
+            added, solutions = self._match_session_solutions(
+                state["groups"], state["solutions"]
+            )
+        self.session_status = (
+            "new" if state is None else "reused" if added is None else "extended"
+        )
+
+        limit = getattr(settings, "WIZARD_SESSION_MAX_SOLUTIONS", 2_000)
+        with self._timed("search"):
+            try:
+                if added is not None:
+                    count, solutions = self._extend_solutions(solutions, added, limit)
+                else:
+                    count, solutions = self._count_solutions(limit)
+            except SearchBudgetExceeded as e:
+                self.search_truncated = True
+                count, solutions = e.partial, None
+        # a timetable with a single class on a day may still be completed into one without, so the timetables can
+        # only be extended when that is allowed
+        if not self._options["allow_one_class_a_day"]:
+            solutions = None
+
+        set_session(
+            token,
+            {
+                "groups": groups,
+                "options": self._options,
+                "version": version,
+                "fixed": self._fixed_sections,
+                "pairs": self._known_pairs,
+                "solutions": (
+                    None
+                    if solutions is None
+                    else [
+                        tuple(
+                            self._candidates[chosen[gr_num]]
+                            for gr_num in range(len(groups))
+                        )
+                        for chosen in solutions
+                    ]
+                ),
+            },
+        )
+
+        return count, token
+
+    def _match_session_solutions(self, session_groups, session_solutions):
+        """
+        If self._groups are the groups of a session plus one, returns the index of the added group and the timetables
+        of the session as dictionaries that map the index of each group to its chosen candidate. Returns (None, None)
+        otherwise.
+
+        :param session_groups: The canonical groups of the session
+        :param session_solutions: The timetables of the session, as tuples of the timeslots of each group
+        """
+
+        if len(self._opened_section_id_groups) != len(session_groups) + 1:
+            return None, None
+
+        free_positions = {}
+        for gr_num, group in enumerate(self._opened_section_id_groups):
+            free_positions.setdefault(tuple(group), []).append(gr_num)
+        positions = []
+        for group in session_groups:
+            free = free_positions.get(tuple(group))
+            if not free:
+                return None, None
+            positions.append(free.pop(0))
+        (added,) = [gr_num for free in free_positions.values() for gr_num in free]
+
+        candidates = [
+            {timeslots: candidate for candidate, timeslots in zip(candidates, group)}
+            for candidates, group in zip(self._group_candidates, self._groups)
+        ]
+        solutions = []
+        for timeslots_list in session_solutions:
+            chosen = {}
+            for gr_num, timeslots in zip(positions, timeslots_list):
+                if timeslots not in candidates[gr_num]:
+                    return None, None
+                chosen[gr_num] = candidates[gr_num][timeslots]
+            solutions.append(chosen)
+
+        return added, solutions
+
+    def _extend_solutions(
+        self, solutions: list[dict[int, int]], gr_num: int, limit: int
+    ):
+        """
+        Count the timetables that complete the given timetables with a candidate of one more group. Returns the count
+        and the completed timetables, or None instead of them if there are more than limit.
+
+        :param solutions: Dictionaries that map the index of each group but one to its chosen candidate
+        :param gr_num: The index of the group to complete them with
+        :param limit: The maximum number of timetables to return
+        """
+
+        count = 0
+        extended = []
+        for chosen in solutions:
+            try:
+                self._spend_node()
+            except SearchBudgetExceeded as e:
+                e.partial = count
+                raise
+            compatibles = self._group_masks[gr_num]
+            weight = 1
+            for candidate in chosen.values():
+                compatibles &= self._compatibles[candidate]
+                weight *= self._weights[candidate]
+            if self._consec_binding or self._days_binding:
+                self._reset_day_spans(chosen)
+
+            for candidate in iter_bits(compatibles):
+                if not self.insertable(candidate, chosen, compatibles):
+                    continue
+                self.search_counters["solutions"] += 1
+                count += weight * self._weights[candidate]
+                if extended is not None and len(extended) == limit:
+                    extended = None
+                elif extended is not None:
+                    extended.append({**chosen, gr_num: candidate})
+
+        return count, extended
+
+    def _count_solutions(self, limit: int):
+        """
+        Count the timetables, by generating them if there are at most limit, and with count_timetables otherwise.
+        Returns the count and the generated timetables, or None instead of them if there are more than limit.
+
+        :param limit: The maximum number of timetables to generate
+        """
+
+        compatibles = bit_range(0, len(self._candidates))
+        remaining = list(range(len(self._groups)))
+        if self._domain_wiped_out(remaining, compatibles):
+            return 0, []
+
+        count = 0
+        solutions = []
+        search = self._generate_timetables(remaining, dict(), compatibles)
+        try:
+            for _, chosen in search:
+                if len(solutions) == limit:
+                    solutions = None
+                    break
+                solutions.append(chosen)
+                weight = 1
+                for candidate in chosen.values():
+                    weight *= self._weights[candidate]
+                count += weight
+        except SearchBudgetExceeded as e:
+            e.partial = count
+            raise
+        finally:
+            search.close()
+
+        if solutions is not None:
+            return count, solutions
+
+        self._start_count_memo(optional=True)
+        return self._count_timetables(tuple(remaining), dict(), compatibles), None
+
+    def iter_timetables(self, opened_section_id_groups, options):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return a generator of
+        possible timetables. The groups and options are validated and loaded right away, while the timetables are
+        searched and realized as the generator is consumed.
 
-                if timeslots not in group:
-                    group[timeslots] = []
-                group[timeslots].append(op_sec)
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        """
+        self.prepare_groups(opened_section_id_groups, options)
+
+        return self._limit_results(
+            realization
+            for _, timetable in self.iter_generated_timetables()
+            for _, realization in self._realize_timetables(timetable)
+        )
+
+    def get_timetables_page(
+        self, opened_section_id_groups, options, limit, cursor=None
+    ):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return at most `limit`
+        possible timetables following the cursor, and the cursor of the next page or None if there is none.
+        The search resumes from the position encoded in the cursor instead of recomputing the previous pages.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        :param limit: The maximum number of timetables to return
+        :param cursor: The cursor returned with the previous page
+        """
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise ValueError("Invalid limit")
+
+        # the cursor holds positions in the loaded sections, so it is only valid for the data it was made with
+        self.validate_opened_section_id_groups(opened_section_id_groups)
+        fingerprint = request_fingerprint(
+            opened_section_id_groups,
+            options,
+            self._fixed_sections,
+            self._data_version(opened_section_id_groups),
+        )
+        path = positions = None
+        if cursor is not None:
+            path, positions = decode_cursor(cursor, fingerprint)
+
+        self.prepare_groups(opened_section_id_groups, options)
+        if path is not None and not len(path) == len(positions) == len(self._groups):
+            raise ValueError("Invalid cursor")
+
+        timetables = []
+        next_cursor = cursor
+        for timetable_path, timetable in self.iter_generated_timetables(path):
+            after = positions if timetable_path == path else None
+            for realization_positions, realization in self._realize_timetables(
+                timetable, after
+            ):
+                if len(timetables) == limit:
+                    return timetables, next_cursor
+                timetables.append(realization)
+                self.search_counters["results"] += 1
+                next_cursor = encode_cursor(
+                    timetable_path, realization_positions, fingerprint
+                )
+
+        # a page cut short by the budget can be resumed from its last timetable
+        return timetables, next_cursor if self.search_truncated else None
+
+    def get_timetables(self, opened_section_id_groups, options):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return a list of possible timetables.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        """
+        key = self._cache_key("timetables", opened_section_id_groups, options)
+
+        # the search runs on the canonical groups, so that the cached timetables only need their sections reordered
+        order = sorted(
+            range(len(opened_section_id_groups)),
+            key=lambda gr_num: sorted(set(opened_section_id_groups[gr_num])),
+        )
+
+        timetables = None if self.collect_stats else get_result(key)
+        if timetables is not None:
+            self.cache_status = "hit"
+            self.search_timings = {}
+            self._start_budget()
+            timetables = list(self._limit_results(timetables))
+        else:
+            self.cache_status = "miss"
+            self.prepare_groups(canonical_groups(opened_section_id_groups), options)
+            self.generate_timetables()
+            self.realize_timetables()
+            timetables = self.realized_timetables
+            if not self.search_truncated:
+                set_result(key, timetables, len(timetables))
+
+        self.realized_timetables = [
+            self._to_request_order(timetable, order) for timetable in timetables
+        ]
+
+        return self.realized_timetables
+
+    def _cache_key(self, kind: str, opened_section_id_groups, options):
+        """
+        Validate the groups and options, and return the key of their result in the wizard cache. The key covers the
+        canonical groups, the validated options, and the data version of the semesters of the sections.
+
+        :param kind: What the result is, e.g. "timetables" or "count"
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        """
+        self.validate_opened_section_id_groups(opened_section_id_groups)
+        self.validate_options(options)
+
+        groups = canonical_groups(opened_section_id_groups)
+
+        return make_key(
+            kind,
+            groups,
+            self._options,
+            self._data_version(groups),
+            self._fixed_sections,
+        )
+
+    def _data_version(self, opened_section_id_groups):
+        """
+        Returns the data version of the semesters of the sections of the groups, see get_data_version.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        """
+
+        semester_ids = (
+            OpenedSection.objects.filter(
+                id__in=[id_ for group in opened_section_id_groups for id_ in group]
+            )
+            .values_list("semester_id", flat=True)
+            .distinct()
+        )
+        return get_data_version(semester_ids)
+
+    def _to_request_order(self, timetable: list[OpenedSection], order: list[int]):
+        """
+        Reorder the sections of a timetable of the canonical groups to the order of the requested groups.
+
+        :param timetable: A list of OpenedSection objects, one from each canonical group
+        :param order: The index of the requested group of each canonical group
+        """
+
+        reordered = [None] * len(timetable)
+        for canonical_gr_num, gr_num in enumerate(order):
+            reordered[gr_num] = timetable[canonical_gr_num]
+        return reordered
+
+    def get_sampled_timetables(self, opened_section_id_groups, options, n, seed=None):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return n possible timetables drawn uniformly at random, without generating all of them.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        :param n: The number of timetables to return
+        :param seed: The seed of the draw, to draw the same timetables again
+        """
+        if (
+            not isinstance(n, int)
+            or isinstance(n, bool)
+            or not 1 <= n <= self.MAX_SAMPLES
+        ):
+            raise ValueError(f"n must be between 1 and {self.MAX_SAMPLES}")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise ValueError("Invalid seed")
+
+        self.prepare_groups(opened_section_id_groups, options)
+
+        return self.sample_timetables(n, random.Random(seed))
+
+    def get_alternative_sections(self, opened_section_ids, course_id, options):
+        """
+        Given the OpenedSection ids of a schedule, a course, and a dictionary of options, return the other OpenedSection
+        objects of the course that fit in the schedule without moving its other sections, the ones with the most open
+        seats first.
+        The other sections of the schedule are taken as they are, each in a group of its own, so that the sections of
+        the course that conflict with them are excluded before the search, see exclude_settled_conflicts. The options
+        still apply to the whole schedule.
+
+        :param opened_section_ids: A list of OpenedSection queryset objects' ids
+        :param course_id: The id of the Course to find alternative sections of
+        :param options: A dictionary of options
+        """
+        if not isinstance(opened_section_ids, list) or not all(
+            isinstance(id_, int) and not isinstance(id_, bool)
+            for id_ in opened_section_ids
+        ):
+            raise ValueError("Invalid section ID")
+        if not isinstance(course_id, int) or isinstance(course_id, bool):
+            raise ValueError("Invalid course")
+        self.validate_options(options)
+
+        schedule = list(
+            OpenedSection.objects.filter(id__in=opened_section_ids).values_list(
+                "id", "semester_id", "section__course_id"
+            )
+        )
+        semester_ids = {semester_id for _, semester_id, _ in schedule}
+        if len(semester_ids) != 1:
+            raise ValueError("The sections must be of a single semester")
+
+        current = [id_ for id_, _, course in schedule if course == course_id]
+        alternatives = self.exclude_sections(
+            OpenedSection.objects.filter(
+                semester_id=semester_ids.pop(), section__course_id=course_id
+            ).exclude(id__in=current)
+        ).values_list("id", flat=True)
+        opened_section_id_groups = [
+            [id_] for id_, _, course in schedule if course != course_id
+        ] + [list(alternatives)]
+
+        self.validate_opened_section_id_groups(opened_section_id_groups)
+        # the sections of the schedule are kept whatever the options, only the alternatives are excluded by them
+        self._fixed_sections = tuple(
+            sorted(id_ for id_, _, course in schedule if course != course_id)
+        )
+        self.search_timings = {}
+        with self._timed("load"):
+            groups = self.to_timeslot_groups(opened_section_id_groups, exclude=False)
+        # a section of the schedule without meetings does not conflict with anything
+        self._groups = [group for group in groups[:-1] if group] + groups[-1:]
+        self.generate_timetables()
+
+        # the sections of the course are the last group of each timetable
+        op_secs = [
+            op_sec
+            for timetable in self.generated_timetables
+            for op_sec in list(timetable.values())[-1]
+        ]
+        self.search_counters["results"] = len(op_secs)
+
+        return sorted(
+            op_secs, key=lambda op_sec: (-(op_sec.open_seats or 0), op_sec.id)
+        )
+
+    def get_ranked_timetables(self, opened_section_id_groups, options, rank_by, k):
+        """
+        Given a list of OpenedSection queryset objects(group), and a dictionary of options, return the k best possible timetables by a ranking.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        :param rank_by: One of RANKINGS
+        :param k: The number of timetables to return
+        """
+        if rank_by not in self.RANKINGS:
+            raise ValueError(f"rank_by must be one of {list(self.RANKINGS)}")
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise ValueError("Invalid k")
+
+        self.prepare_groups(opened_section_id_groups, options)
+
+        max_results = self._budget["max_results"] if self._budget else None
+        if max_results is None or max_results >= k:
+            timetables = self.rank_timetables(rank_by, k)
+        else:
+            # look for one more than the budget allows to tell if any was left out
+            timetables = self.rank_timetables(rank_by, max_results + 1)
+            if len(timetables) > max_results:
+                timetables = timetables[:max_results]
+                self.search_truncated = True
+        self.search_counters["results"] = len(timetables)
+
+        return timetables
+
+    def realize_timetables(self):
+        """
+        Realize the timetables by picking one OpenedSection from each generated timetables to form a list of timetables that are a list of OpenedSection objects.
+        """
+
+        if self.generated_timetables is None:
+            return
+
+        with self._timed("realize"):
+            self.realized_timetables = list(
+                self._limit_results(
+                    realization
+                    for timetable in self.generated_timetables
+                    for _, realization in self._realize_timetables(timetable)
+                )
+            )
+
+    def _realize_timetables(
+        self,
+        timetable: dict[
+            tuple[tuple[str, datetime.time, datetime.time]], list[OpenedSection]
+        ],
+        after: tuple[int] | None = None,
+    ):
+        """
+        Lazily realize a generated timetable by picking one OpenedSection from each of its timeslots, yielding lists of OpenedSection objects with the positions of the picked OpenedSection objects.
+
+        :param timetable: A dictionary that maps timeslots to OpenedSection objects
+        :param after: The positions of a realization to resume from, exclusive
+        """
+
+        op_secs_list = list(timetable.values())
+        for positions in iter_positions(
+            [len(op_secs) for op_secs in op_secs_list], after
+        ):
+            yield positions, [
+                op_secs[position] for op_secs, position in zip(op_secs_list, positions)
+            ]
+
+    def prepare_groups(self, opened_section_id_groups, options, prefetch=True):
+        """
+        Validate the groups and options, and load the groups into self._groups.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param options: A dictionary of options
+        :param prefetch: Whether to load the related fields required in response
+        """
+        self.validate_opened_section_id_groups(opened_section_id_groups)
+        self.validate_options(options)
+        self.search_timings = {}
+        with self._timed("load"):
+            self._groups = self.to_timeslot_groups(
+                self._opened_section_id_groups, prefetch
+            )
+
+    def validate_opened_section_id_groups(self, opened_section_id_groups):
+        """
+        Given a list of OpenedSection queryset objects(group), validate if the groups are valid.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        """
+
+        if not all(isinstance(group, list) for group in opened_section_id_groups):
+            raise ValueError("Invalid groups")
+
+        for group in opened_section_id_groups:
+            if not all(isinstance(id_, int) for id_ in group):
+                raise ValueError("Invalid section ID")
+
+        self._opened_section_id_groups = opened_section_id_groups
+
+    def validate_options(self, options: dict):
+        """
+        Given a dictionary of options, validate if the options are valid.
+
+        :param options: A dictionary of options
+        """
+        validated_options = {}
+
+        for opt, validate in self.OPTIONS_SPEC.items():
+            if opt not in options and opt in self.OPTIONS_DEFAULTS:
+                validated_options[opt] = self.OPTIONS_DEFAULTS[opt]
+                continue
+            if opt not in options:
+                raise ValueError(f"Missing option '{opt}'")
+
+            try:
+                validated_options[opt] = validate(options[opt])
+            except (ValueError, TypeError):
+                raise ValueError(f"Invalid value for option '{opt}'")
+
+        self._options = validated_options
+
+    def opened_sections(self, ids, prefetch: bool = True):
+        """
+        Returns the queryset of the OpenedSection objects with the given ids, ordered by id.
+
+        :param ids: OpenedSection queryset objects' ids
+        :param prefetch: Whether to load the related fields required in response
+        """
+
+        queryset = OpenedSection.objects.filter(id__in=ids).order_by("id")
+
+        # prefetch related fields required in response
+        if prefetch:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    lookup="meeting_set",
+                    queryset=Meeting.objects.select_related(
+                        "duration", "day", "location", "location__building"
+                    ),
+                ),
+                Prefetch(
+                    lookup="teach_set",
+                    queryset=Teach.objects.select_related("instructor"),
+                ),
+            )
+            queryset = queryset.select_related("section__course")
+
+        return queryset
+
+    def exclude_sections(self, queryset):
+        """
+        Exclude from a queryset of OpenedSection objects the sections ruled out by the options, so that they are never
+        loaded: the ones that have no seats available if allow_only_open_section, the ones with a meeting that starts
+        before minimum_start_time, and the ones with a meeting on one of the days_off.
+
+        :param queryset: A queryset of OpenedSection objects
+        """
+
+        if self._options is None:
+            return queryset
+
+        if self._options["allow_only_open_section"] is True:
+            queryset = queryset.filter(open_seats__gt=0)
+        min_start_time = self._options["minimum_start_time"]
+        if min_start_time is not None and min_start_time > time.min:
+            queryset = queryset.exclude(
+                meeting__duration__start_time__lt=min_start_time
+            )
+        if self._options["days_off"]:
+            queryset = queryset.exclude(meeting__day__day__in=self._options["days_off"])
+
+        return queryset
+
+    def to_timeslot_groups(
+        self,
+        opened_section_id_groups: list[list[int]],
+        prefetch: bool = True,
+        exclude: bool = True,
+    ):
+        """
+        Given a list of OpenedSection queryset objects(group), convert to a dict that maps timeslots to OpenedSection objects.
+        Cache the results in self._groups
+        The sections of all groups are loaded at once, in a constant number of queries, without the sections excluded
+        by the options. Their timeslots are read from the schedule column, and built from their meetings for sections
+        that do not have one yet.
+
+        :param opened_section_id_groups: A list of OpenedSection queryset objects' ids
+        :param prefetch: Whether to load the related fields required in response
+        :param exclude: Whether to leave out the sections excluded by the options, see exclude_sections. The fixed
+            sections are never left out, see with_fixed_sections
+        """
+
+        ids = {id_ for group in opened_section_id_groups for id_ in group}
+        queryset = self.opened_sections(ids, prefetch)
+        if exclude and self._fixed_sections:
+            queryset = queryset.filter(
+                Q(id__in=self._fixed_sections)
+                | Q(
+                    id__in=self.exclude_sections(
+                        OpenedSection.objects.filter(id__in=ids)
+                    ).values("id")
+                )
+            )
+        elif exclude:
+            queryset = self.exclude_sections(queryset)
+        op_secs = {op_sec.id: op_sec for op_sec in queryset}
+
+        schedules = {
+            id_: op_sec.schedule
+            for id_, op_sec in op_secs.items()
+            if op_sec.schedule is not None
+        }
+        missing = [id_ for id_ in op_secs if id_ not in schedules]
+        if prefetch:
+            for id_ in missing:
+                schedules[id_] = OpenedSection.to_schedule(
+                    (
+                        meeting.day.day,
+                        meeting.duration.start_time,
+                        meeting.duration.end_time,
+                    )
+                    for meeting in op_secs[id_].meeting_set.all()
+                )
+        elif missing:
+            timeslots = {id_: [] for id_ in missing}
+            for id_, *timeslot in Meeting.objects.filter(
+                opened_section_id__in=missing
+            ).values_list(
+                "opened_section_id",
+                "day__day",
+                "duration__start_time",
+                "duration__end_time",
+            ):
+                timeslots[id_].append(tuple(timeslot))
+            for id_ in missing:
+                schedules[id_] = OpenedSection.to_schedule(timeslots[id_])
+
+        timeslots_of = {
+            id_: tuple(
+                (day, time(*divmod(start, 60)), time(*divmod(end, 60)))
+                for day, start, end in schedule
+            )
+            for id_, schedule in schedules.items()
+            # filter out sections that have no meetings
+            if schedule
+        }
+
+        # convert to a dict that maps timeslots to OpenedSection objects
+        groups = []
+        for opened_section_id_group in opened_section_id_groups:
+            group: dict[tuple, list[OpenedSection]] = {}
+            for id_ in sorted(set(opened_section_id_group) & timeslots_of.keys()):
+                group.setdefault(timeslots_of[id_], []).append(op_secs[id_])
             groups.append(group)
 
         return groups
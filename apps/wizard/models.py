@@ -1,3 +1,35 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class WizardJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    request = models.JSONField("Groups, options and budget of the search")
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    nodes = models.BigIntegerField("Number of search nodes visited", default=0)
+    results = models.IntegerField("Number of timetables found", default=0)
+    truncated = models.BooleanField(default=False)
+    timetables = models.JSONField(
+        "Lists of OpenedSection ids of the timetables found", blank=True, null=True
+    )
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user}'s wizard job {self.id} ({self.status})"
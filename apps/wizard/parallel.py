@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+_process_pool = None
+_process_pool_workers = None
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool of this process for parallel wizard searches, created on first use so that every
+    gunicorn worker owns its own pool.
+
+    :param workers: The number of worker processes
+    """
+
+    global _process_pool, _process_pool_workers
+
+    if _process_pool is None or _process_pool_workers != workers:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+        _process_pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=django.setup
+        )
+        _process_pool_workers = workers
+
+    return _process_pool
+
+
+def solve_subproblem(problem: dict, subproblem: tuple, mode: str, budget: dict):
+    """
+    Solve one subproblem of a wizard search in a worker process.
+    Returns (result, search counters, whether the budget ran out), where result is the count of the subproblem's
+    timetables for mode "count", and the list of their chosen candidates for mode "generate".
+
+    :param problem: A dictionary made by GenerateTimeTableMixin.export_problem
+    :param subproblem: A tuple of (remaining, chosen, compatibles, path) made by GenerateTimeTableMixin._split_search
+    :param mode: "count" or "generate"
+    :param budget: The budget of the subproblem
+    """
+
+    from apps.wizard.mixins import GenerateTimeTableMixin, SearchBudgetExceeded
+
+    mixin = GenerateTimeTableMixin()
+    mixin.load_problem(problem)
+    mixin._budget = budget
+    mixin._start_budget()
+
+    remaining, chosen, compatibles, path = subproblem
+    mixin._reset_day_spans(chosen)
+    if mode == "count":
+        mixin._start_count_memo(optional=True)
+        try:
+            result = mixin._count_timetables(tuple(remaining), chosen, compatibles)
+        except SearchBudgetExceeded as e:
+            mixin.search_truncated = True
+            result = e.partial
+    else:
+        result = []
+        max_results = budget["max_results"]
+        try:
+            for _, solution in mixin._generate_timetables(
+                list(remaining), chosen, compatibles, path
+            ):
+                result.append(solution)
+                # every solution is at least one timetable, so one more than the budget tells that some are left out
+                if max_results is not None and len(result) > max_results:
+                    break
+        except SearchBudgetExceeded:
+            mixin.search_truncated = True
+
+    return result, mixin.search_counters, mixin.search_truncated
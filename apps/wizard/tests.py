@@ -1,3 +1,1335 @@
-from django.test import TestCase
+from datetime import time, timedelta
+import json
+import os
+import tempfile
+from collections import Counter
+from io import StringIO
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.courses.models import (
+    Building,
+    Course,
+    Day,
+    Department,
+    Duration,
+    Institution,
+    Instructor,
+    Location,
+    Meeting,
+    OpenedSection,
+    Section,
+    Semester,
+    Teach,
+)
+from apps.wizard.benchmarks import find_regressions
+from apps.wizard.cache import (
+    bump_data_version,
+    get_cache,
+    get_data_version,
+    make_key,
+)
+from apps.wizard.mixins import GenerateTimeTableMixin
+from apps.wizard.models import WizardJob
+from apps.wizard.serializers import OpenedSectionWithCourseNameSerializer
+from apps.users.models import User
+
+
+def create_opened_section_id_groups(n_groups, n_sections):
+    """
+    Create n_groups courses of n_sections opened sections each, meeting twice a week with an instructor.
+    Returns their ids grouped by course.
+    """
+
+    institution = Institution.objects.create(full_name="University", nickname="U")
+    semester = Semester.objects.get_or_create(code=202401)[0]
+    location = Location.objects.create(
+        room="1115", building=Building.objects.get_or_create(nickname="CSI")[0]
+    )
+    instructor = Instructor.objects.create(name="Instructor")
+    days = [Day.objects.get_or_create(day=day)[0] for day in ("M", "Tu", "W", "Th")]
+
+    opened_section_id_groups = []
+    for course_idx in range(n_groups):
+        course = Course.objects.create(
+            name=f"Course {course_idx}",
+            course_code=f"CMSC{course_idx}",
+            credits=3,
+            institution=institution,
+        )
+        group = []
+        for section_idx in range(n_sections):
+            section = Section.objects.create(
+                course=course, section_code=f"{section_idx:04}"
+            )
+            opened_section = OpenedSection.objects.create(
+                semester=semester, section=section, seats=10, open_seats=5
+            )
+            hour = 8 + section_idx % 10
+            duration = Duration.objects.get_or_create(
+                start_time=time(hour, 0), end_time=time(hour, 50)
+            )[0]
+            for day in days[section_idx % 2 :: 2]:
+                Meeting.objects.create(
+                    duration=duration,
+                    day=day,
+                    location=location,
+                    opened_section=opened_section,
+                )
+            Teach.objects.create(instructor=instructor, opened_section=opened_section)
+            group.append(opened_section.id)
+        opened_section_id_groups.append(group)
+
+    return opened_section_id_groups
+
+
+class ConstraintsTest(TestCase):
+    # on Monday, with gaps in minutes:
+    # A1 09:00-09:50
+    # B1 09:53-10:43 (A1: 3), B2 10:07-10:57 (A1: 17), B3 12:01-12:51 (A1: 131)
+    # C1 10:58-11:48 (A1: 68, B1: 15, B2: 1, B3: 13), C2 13:06-13:56 (A1: 196, B1: 143, B2: 129, B3: 15)
+    SECTIONS = {
+        "A": {"A1": ("09:00", "09:50")},
+        "B": {
+            "B1": ("09:53", "10:43"),
+            "B2": ("10:07", "10:57"),
+            "B3": ("12:01", "12:51"),
+        },
+        "C": {"C1": ("10:58", "11:48"), "C2": ("13:06", "13:56")},
+    }
+    OPTIONS = {
+        "minimum_start_time": "08:00",
+        "minimum_interval": "00:00",
+        "maximum_interval": "23:59",
+        "allow_consec": 3,
+        "allow_one_class_a_day": True,
+        "allow_only_open_section": False,
+    }
+
+    def setUp(self):
+        institution = Institution.objects.create(full_name="University", nickname="U")
+        semester = Semester.objects.create(code=202401)
+        location = Location.objects.create(
+            room="1115", building=Building.objects.create(nickname="CSI")
+        )
+        monday = Day.objects.get_or_create(day="M")[0]
+
+        self.opened_section_id_groups = []
+        for course_code, sections in self.SECTIONS.items():
+            course = Course.objects.create(
+                name=course_code,
+                course_code=course_code,
+                credits=3,
+                institution=institution,
+            )
+            group = []
+            for section_code, (start, end) in sections.items():
+                opened_section = OpenedSection.objects.create(
+                    semester=semester,
+                    section=Section.objects.create(
+                        course=course, section_code=section_code
+                    ),
+                    seats=10,
+                    open_seats=5,
+                )
+                Meeting.objects.create(
+                    duration=Duration.objects.create(
+                        start_time=time.fromisoformat(start),
+                        end_time=time.fromisoformat(end),
+                    ),
+                    day=monday,
+                    location=location,
+                    opened_section=opened_section,
+                )
+                group.append(opened_section.id)
+            self.opened_section_id_groups.append(group)
+
+    def timetables(self, **options):
+        return sorted(
+            "".join(op_sec.section.section_code[1] for op_sec in table[1:])
+            for table in GenerateTimeTableMixin().get_timetables(
+                self.opened_section_id_groups, {**self.OPTIONS, **options}
+            )
+        )
+
+    def test_constraints(self):
+        # the B and C sections of each timetable, e.g. "21" for B2 and C1
+        for options, expected in (
+            ({}, ["11", "12", "21", "22", "31", "32"]),
+            # the gaps shorter than the minimum interval are A1-B1 and B2-C1, B3-C1 is exactly 13 minutes
+            ({"minimum_interval": "00:13"}, ["22", "31", "32"]),
+            ({"minimum_interval": "00:14"}, ["22", "32"]),
+            # every pair of classes of a day must be at most the maximum interval apart, A1-C1 is exactly 68 minutes
+            ({"maximum_interval": "01:08"}, ["11", "21"]),
+            ({"maximum_interval": "01:07"}, []),
+            # A1, B1 and C1 are consecutive, with gaps of 3 and exactly 15 minutes
+            ({"allow_consec": 2}, ["12", "21", "22", "31", "32"]),
+            ({"allow_consec": 1}, ["22"]),
+        ):
+            with self.subTest(options=options):
+                self.assertEqual(self.timetables(**options), expected)
+                mixin = GenerateTimeTableMixin()
+                self.assertEqual(
+                    mixin.get_timetables_count(
+                        self.opened_section_id_groups, {**self.OPTIONS, **options}
+                    ),
+                    len(expected),
+                )
+
+    def test_compatibles(self):
+        # the pairs of sections of different courses allowed by the interval options, e.g. "A1B2"
+        # A1 is the only section of A, so the sections it is not compatible with are excluded before the pairs
+        all_pairs = ["A1B1", "A1B2", "A1B3", "A1C1", "A1C2"] + [
+            f"B{b}C{c}" for b in "123" for c in "12"
+        ]
+        for options, expected in (
+            ({}, all_pairs),
+            # B1 is excluded
+            (
+                {"minimum_interval": "00:14"},
+                ["A1B2", "A1B3", "A1C1", "A1C2", "B2C2", "B3C2"],
+            ),
+            # B3 and C2 are excluded
+            (
+                {"maximum_interval": "01:08"},
+                ["A1B1", "A1B2", "A1C1", "B1C1", "B2C1"],
+            ),
+        ):
+            with self.subTest(options=options):
+                mixin = GenerateTimeTableMixin()
+                mixin.validate_options({**self.OPTIONS, **options})
+                mixin._groups = mixin.to_timeslot_groups(self.opened_section_id_groups)
+                mixin.compile_timeslots()
+                mixin.compile_conflicts()
+
+                codes = {}
+                for gr_num, candidates in enumerate(mixin._group_candidates):
+                    for candidate in candidates:
+                        op_secs = mixin._groups[gr_num][mixin._candidates[candidate]]
+                        codes[candidate] = op_secs[0].section.section_code
+                pairs = sorted(
+                    codes[i] + codes[j]
+                    for i in codes
+                    for j in codes
+                    if i < j and mixin._compatibles[i] >> j & 1
+                )
+                self.assertEqual(pairs, expected)
+                for i in codes:
+                    for j in codes:
+                        self.assertEqual(
+                            mixin._compatibles[i] >> j & 1,
+                            mixin._compatibles[j] >> i & 1,
+                        )
+
+    def test_forward_checking(self):
+        # with a maximum interval of 01:07, no C section can be in a timetable with A1, so no branch goes past A1
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(
+            self.opened_section_id_groups,
+            {**self.OPTIONS, "maximum_interval": "01:07"},
+        )
+        with mock.patch.object(
+            mixin, "_generate_timetables", wraps=mixin._generate_timetables
+        ) as search:
+            mixin.generate_timetables()
+        self.assertEqual(mixin.generated_timetables, [])
+        self.assertLessEqual(search.call_count, 1)
+
+    def test_most_constrained_first(self):
+        # the groups are given as C, B, A, but A has the fewest sections, so it is placed first
+        opened_section_id_groups = self.opened_section_id_groups[::-1]
+        # the search runs on the groups as given, and not on the canonical groups of the cache
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(opened_section_id_groups, self.OPTIONS)
+        with mock.patch.object(
+            mixin, "_generate_timetables", wraps=mixin._generate_timetables
+        ) as search:
+            mixin.generate_timetables()
+        mixin.realize_timetables()
+        timetables = mixin.realized_timetables
+        # the first call is the root of the search, the second one has A1 chosen
+        self.assertEqual(list(search.call_args_list[1].args[1]), [2])
+
+        # the sections of each timetable are still in the order of the groups
+        self.assertEqual(
+            sorted(
+                "".join(op_sec.section.section_code for op_sec in table)
+                for table in timetables
+            ),
+            [f"C{c}B{b}A1" for c in "12" for b in "123"],
+        )
+
+
+class CountMemoTest(TestCase):
+    OPTIONS = {
+        "minimum_start_time": "08:00",
+        "minimum_interval": "00:00",
+        "maximum_interval": "23:59",
+        "allow_consec": 2,
+        "allow_one_class_a_day": True,
+        "allow_only_open_section": False,
+    }
+
+    def test_count_memo(self):
+        # the sections meet for 50 minutes at 8:00, 9:00, ..., so that classes of one group are consecutive
+        opened_section_id_groups = create_opened_section_id_groups(4, 6)
+        timetables = GenerateTimeTableMixin().get_timetables(
+            opened_section_id_groups, self.OPTIONS
+        )
+
+        for probe, expected_memo in ((1, None), (10**6, dict)):
+            mixin = GenerateTimeTableMixin()
+            mixin.COUNT_MEMO_PROBE = probe
+            mixin.prepare_groups(opened_section_id_groups, self.OPTIONS)
+            self.assertEqual(mixin.count_timetables(), len(timetables))
+            self.assertTrue(mixin._consec_binding)
+            if expected_memo is None:
+                # the memo is given up as it has no hit by its first subproblem
+                self.assertIsNone(mixin._count_memo)
+            else:
+                self.assertIsInstance(mixin._count_memo, expected_memo)
+
+
+class TimetablesPageTest(TestCase):
+    def test_pages(self):
+        opened_section_id_groups = create_opened_section_id_groups(3, 4)
+        options = CountMemoTest.OPTIONS
+        timetables = [
+            [op_sec.id for op_sec in table]
+            for table in GenerateTimeTableMixin().get_timetables(
+                opened_section_id_groups, options
+            )
+        ]
+
+        paged, cursor = [], None
+        while True:
+            page, cursor = GenerateTimeTableMixin().get_timetables_page(
+                opened_section_id_groups, options, 5, cursor
+            )
+            paged += [[op_sec.id for op_sec in table] for table in page]
+            if cursor is None:
+                break
+            last_cursor = cursor
+        self.assertEqual(paged, timetables)
+
+        # a cursor made for other options is rejected
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_timetables_page(
+                opened_section_id_groups, {**options, "allow_consec": 3}, 5, last_cursor
+            )
+
+        # a cursor made before the sections changed is rejected
+        bump_data_version(
+            OpenedSection.objects.get(id=opened_section_id_groups[0][0]).semester_id
+        )
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_timetables_page(
+                opened_section_id_groups, options, 5, last_cursor
+            )
+
+
+class CacheTest(TestCase):
+    def test_bump_data_version(self):
+        opened_section_id_groups = create_opened_section_id_groups(2, 2)
+        semester_id = OpenedSection.objects.get(
+            id=opened_section_id_groups[0][0]
+        ).semester_id
+
+        versions = [get_data_version([semester_id])]
+        for _ in range(2):
+            bump_data_version(semester_id)
+            versions.append(get_data_version([semester_id]))
+        self.assertEqual(len(set(versions)), 3)
+
+        keys = {
+            make_key("count", opened_section_id_groups, {}, version)
+            for version in versions
+        }
+        self.assertEqual(len(keys), 3)
+
+    def test_evicted_data_version(self):
+        opened_section_id_groups = create_opened_section_id_groups(2, 2)
+        semester_id = OpenedSection.objects.get(
+            id=opened_section_id_groups[0][0]
+        ).semester_id
+        options = {**SearchStatsTest.OPTIONS, "allow_only_open_section": True}
+        get_cache().clear()
+
+        mixin = GenerateTimeTableMixin()
+        self.assertEqual(
+            mixin.get_timetables_count(opened_section_id_groups, options), 2
+        )
+        version = get_data_version([semester_id])
+
+        # the version is evicted while the result cached under it is not, and the sections change
+        get_cache().delete(f"wizard:version:{semester_id}")
+        OpenedSection.objects.filter(id=opened_section_id_groups[0][0]).update(
+            open_seats=0
+        )
+
+        mixin = GenerateTimeTableMixin()
+        self.assertEqual(
+            mixin.get_timetables_count(opened_section_id_groups, options), 1
+        )
+        self.assertEqual(mixin.cache_status, "miss")
+        self.assertNotEqual(get_data_version([semester_id]), version)
+
+
+class ToTimeslotGroupsTest(TestCase):
+    def test_groups(self):
+        opened_section_id_groups = create_opened_section_id_groups(2, 4)
+        groups = GenerateTimeTableMixin().to_timeslot_groups(opened_section_id_groups)
+
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(
+            list(groups[0]),
+            [
+                (("M", time(8, 0), time(8, 50)), ("W", time(8, 0), time(8, 50))),
+                (("Th", time(9, 0), time(9, 50)), ("Tu", time(9, 0), time(9, 50))),
+                (("M", time(10, 0), time(10, 50)), ("W", time(10, 0), time(10, 50))),
+                (("Th", time(11, 0), time(11, 50)), ("Tu", time(11, 0), time(11, 50))),
+            ],
+        )
+        self.assertEqual(
+            [op_sec.id for op_secs in groups[1].values() for op_sec in op_secs],
+            opened_section_id_groups[1],
+        )
+
+    def test_query_count_does_not_depend_on_sections(self):
+        small = create_opened_section_id_groups(1, 2)
+        large = create_opened_section_id_groups(6, 40)
+
+        with self.assertNumQueries(3):
+            GenerateTimeTableMixin().to_timeslot_groups(small)
+        with self.assertNumQueries(3):
+            groups = GenerateTimeTableMixin().to_timeslot_groups(large)
+
+        # the related fields of the response are loaded as well
+        with self.assertNumQueries(0):
+            for group in groups:
+                for op_secs in group.values():
+                    for op_sec in op_secs:
+                        op_sec.section.course.name
+                        [teach.instructor.name for teach in op_sec.teach_set.all()]
+                        [
+                            meeting.location.building.nickname
+                            for meeting in op_sec.meeting_set.all()
+                        ]
+
+    def test_schedule_column(self):
+        opened_section_id_groups = create_opened_section_id_groups(3, 10)
+        groups = GenerateTimeTableMixin().to_timeslot_groups(opened_section_id_groups)
+
+        # without schedules, the timeslots are built from the meetings in one more query
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                GenerateTimeTableMixin().to_timeslot_groups(
+                    opened_section_id_groups, prefetch=False
+                ),
+                groups,
+            )
+
+        call_command("backfill_schedules", stdout=StringIO())
+        self.assertEqual(
+            OpenedSection.objects.get(id=opened_section_id_groups[0][0]).schedule,
+            [["M", 480, 530], ["W", 480, 530]],
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                GenerateTimeTableMixin().to_timeslot_groups(
+                    opened_section_id_groups, prefetch=False
+                ),
+                groups,
+            )
+
+    def test_excluded_sections(self):
+        opened_section_id_groups = create_opened_section_id_groups(4, 10)
+        ids = [id_ for group in opened_section_id_groups for id_ in group]
+        # every third section is full, and the 8:00 sections of the first course also meet at 11:00 on Friday
+        OpenedSection.objects.filter(id__in=ids[::3]).update(open_seats=0)
+        late = Duration.objects.get_or_create(
+            start_time=time(11), end_time=time(11, 50)
+        )[0]
+        friday = Day.objects.get_or_create(day="F")[0]
+        location = Location.objects.get()
+        for opened_section in OpenedSection.objects.filter(
+            id__in=opened_section_id_groups[0], meeting__duration__start_time=time(8)
+        ).distinct():
+            Meeting.objects.create(
+                duration=late,
+                day=friday,
+                location=location,
+                opened_section=opened_section,
+            )
+
+        options = {
+            "minimum_start_time": "09:00",
+            "minimum_interval": "00:00",
+            "maximum_interval": "23:59",
+            "allow_consec": 10,
+            "allow_one_class_a_day": True,
+            "allow_only_open_section": True,
+        }
+        expected = [
+            [
+                op_sec.id
+                for op_sec in OpenedSection.objects.filter(id__in=group).order_by("id")
+                if op_sec.open_seats > 0
+                and all(
+                    meeting.duration.start_time >= time(9)
+                    for meeting in op_sec.meeting_set.all()
+                )
+            ]
+            for group in opened_section_id_groups
+        ]
+        self.assertTrue(all(0 < len(group) < 10 for group in expected))
+
+        for prefetch, queries in ((True, 3), (False, 2)):
+            mixin = GenerateTimeTableMixin()
+            with self.assertNumQueries(queries):
+                mixin.prepare_groups(opened_section_id_groups, options, prefetch)
+            self.assertEqual(
+                [
+                    sorted(
+                        op_sec.id for op_secs in group.values() for op_sec in op_secs
+                    )
+                    for group in mixin._groups
+                ],
+                expected,
+            )
+
+
+class BenchmarkTest(TestCase):
+    def test_find_regressions(self):
+        baseline = {"typical": {"count_search": 0.1, "timetables_search": 0.001}}
+        results = {
+            "typical": {"count_search": 0.13, "timetables_search": 0.01, "count": 5}
+        }
+
+        self.assertEqual(
+            find_regressions(results, baseline, 0.2),
+            [("typical", "count_search", 0.1, 0.13)],
+        )
+        self.assertEqual(find_regressions(results, baseline, 0.5), [])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "benchmark.json")
+            call_command(
+                "benchmark_wizard",
+                "--scenarios",
+                "small",
+                "--repeat",
+                "1",
+                "--output",
+                output,
+                stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)["scenarios"]["small"]
+            self.assertEqual(results["count"], results["timetables"])
+            self.assertIn("timetables_realize", results)
+
+            # the synthetic catalog is rolled back
+            self.assertFalse(OpenedSection.objects.exists())
+
+            stdout = StringIO()
+            call_command(
+                "benchmark_wizard",
+                "--scenarios",
+                "small",
+                "--repeat",
+                "1",
+                "--compare",
+                output,
+                "--threshold",
+                "100",
+                stdout=stdout,
+            )
+            self.assertIn("No regression", stdout.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark_wizard", "--compare", output, stdout=StringIO())
+
+
+class SearchStatsTest(TestCase):
+    OPTIONS = {
+        "minimum_start_time": "08:00",
+        "minimum_interval": "00:00",
+        "maximum_interval": "23:59",
+        "allow_consec": 2,
+        "allow_one_class_a_day": True,
+        "allow_only_open_section": False,
+    }
+
+    def test_stats(self):
+        opened_section_id_groups = create_opened_section_id_groups(3, 6)
+
+        mixin = GenerateTimeTableMixin()
+        timetables = mixin.get_timetables(opened_section_id_groups, self.OPTIONS)
+        self.assertNotIn("stats", mixin.search_report())
+
+        mixin = GenerateTimeTableMixin()
+        mixin.set_stats(True)
+        mixin.prepare_groups(opened_section_id_groups, self.OPTIONS)
+        mixin.generate_timetables()
+        mixin.realize_timetables()
+        self.assertEqual(mixin.realized_timetables, timetables)
+
+        stats = mixin.search_report()["stats"]
+        self.assertEqual(stats["solutions"], len(mixin.generated_timetables))
+        self.assertEqual(set(stats["pruned"]), set(GenerateTimeTableMixin.PRUNES))
+        # sections of different courses at the same time overlap
+        self.assertGreater(stats["pruned"]["overlap"], 0)
+        self.assertEqual(
+            set(stats["timings"]), {"load", "compile", "search", "realize"}
+        )
+
+
+class CountSessionTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def count(self, opened_section_id_groups):
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(opened_section_id_groups, self.OPTIONS, prefetch=False)
+        return mixin.count_timetables()
+
+    def test_session(self):
+        opened_section_id_groups = create_opened_section_id_groups(4, 4)
+
+        token = None
+        statuses = []
+        for gr_nums in ([0, 1], [0, 1, 2], [0, 2], [3, 2, 0]):
+            groups = [opened_section_id_groups[gr_num] for gr_num in gr_nums]
+            mixin = GenerateTimeTableMixin()
+            count, token = mixin.get_timetables_count_in_session(
+                groups, self.OPTIONS, token
+            )
+            self.assertEqual(count, self.count(groups))
+            statuses.append(mixin.session_status)
+
+        # adding a group extends the timetables of the session, removing one only reuses its pairs of timeslots
+        self.assertEqual(statuses, ["new", "extended", "reused", "extended"])
+
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_timetables_count_in_session(
+                opened_section_id_groups, self.OPTIONS, "token"
+            )
+
+
+class SampleTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def test_sample(self):
+        opened_section_id_groups = create_opened_section_id_groups(3, 5)
+        timetables = {
+            tuple(op_sec.id for op_sec in table)
+            for table in GenerateTimeTableMixin().get_timetables(
+                opened_section_id_groups, self.OPTIONS
+            )
+        }
+
+        samples = GenerateTimeTableMixin().get_sampled_timetables(
+            opened_section_id_groups, self.OPTIONS, 10, seed=1
+        )
+        ids = [tuple(op_sec.id for op_sec in table) for table in samples]
+        self.assertEqual(len(set(ids)), 10)
+        self.assertTrue(set(ids) <= timetables)
+        # the same seed draws the same timetables
+        self.assertEqual(
+            GenerateTimeTableMixin().get_sampled_timetables(
+                opened_section_id_groups, self.OPTIONS, 10, seed=1
+            ),
+            samples,
+        )
+
+        # asking for more timetables than there are returns all of them
+        samples = GenerateTimeTableMixin().get_sampled_timetables(
+            opened_section_id_groups, self.OPTIONS, len(timetables) + 1
+        )
+        self.assertEqual(
+            {tuple(op_sec.id for op_sec in table) for table in samples}, timetables
+        )
+
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_sampled_timetables(
+                opened_section_id_groups, self.OPTIONS, 0
+            )
+
+
+class FixedSectionsTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def test_fixed(self):
+        opened_section_id_groups = create_opened_section_id_groups(4, 6)
+        fixed = [opened_section_id_groups[0][0], opened_section_id_groups[1][3]]
+        groups = opened_section_id_groups[2:]
+
+        mixin = GenerateTimeTableMixin()
+        timetables = mixin.get_timetables(
+            mixin.with_fixed_sections(groups, fixed), self.OPTIONS
+        )
+        self.assertTrue(timetables)
+        self.assertEqual(
+            len(timetables),
+            GenerateTimeTableMixin().get_timetables_count(
+                [[fixed[0]], [fixed[1]]] + groups, self.OPTIONS
+            ),
+        )
+        for table in timetables:
+            self.assertEqual([op_sec.id for op_sec in table[:2]], fixed)
+
+        # the sections at the times of the fixed sections are excluded before the search
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(mixin.with_fixed_sections(groups, fixed), self.OPTIONS)
+        mixin.compile()
+        self.assertEqual([len(group) for group in mixin._groups], [1, 1, 4, 4])
+
+        # a fixed section is kept even if the options exclude it, unlike the same section in a group
+        OpenedSection.objects.filter(id=fixed[0]).update(open_seats=0)
+        options = {**self.OPTIONS, "allow_only_open_section": True}
+        mixin = GenerateTimeTableMixin()
+        self.assertEqual(
+            mixin.get_timetables_count(
+                mixin.with_fixed_sections(groups, fixed), options
+            ),
+            len(timetables),
+        )
+        self.assertEqual(
+            GenerateTimeTableMixin().get_timetables_count(
+                [[fixed[0]], [fixed[1]]] + groups, options
+            ),
+            0,
+        )
+
+        # a fixed section without meetings is left out
+        op_sec = OpenedSection.objects.get(id=fixed[0])
+        online = OpenedSection.objects.create(
+            semester=op_sec.semester,
+            section=Section.objects.create(
+                course=op_sec.section.course, section_code="9999"
+            ),
+            seats=10,
+            open_seats=5,
+        )
+        self.assertEqual(
+            mixin.with_fixed_sections(groups, [online.id] + fixed),
+            [[fixed[0]], [fixed[1]]] + groups,
+        )
+
+        with self.assertRaises(ValueError):
+            mixin.with_fixed_sections(groups, [str(fixed[0])])
+
+
+class DayOptionsTest(TestCase):
+    def timetable_days(self, timetables):
+        return [
+            Counter(
+                meeting.day.day
+                for op_sec in table
+                for meeting in op_sec.meeting_set.all()
+            )
+            for table in timetables
+        ]
+
+    def test_day_options(self):
+        opened_section_id_groups = create_opened_section_id_groups(3, 6)
+        options = {**SearchStatsTest.OPTIONS, "allow_consec": 3}
+        timetables = GenerateTimeTableMixin().get_timetables(
+            opened_section_id_groups, options
+        )
+        days = self.timetable_days(timetables)
+
+        for day_options, allowed in (
+            ({"days_off": ["M"]}, lambda days: "M" not in days),
+            ({"max_campus_days": 2}, lambda days: len(days) <= 2),
+            (
+                {"allow_one_class_a_day": False},
+                lambda days: 1 not in days.values(),
+            ),
+        ):
+            mixin = GenerateTimeTableMixin()
+            filtered = mixin.get_timetables(
+                opened_section_id_groups, {**options, **day_options}
+            )
+            expected = [
+                table
+                for table, table_days in zip(timetables, days)
+                if allowed(table_days)
+            ]
+            self.assertTrue(0 < len(expected) < len(timetables))
+            self.assertEqual(
+                sorted([op_sec.id for op_sec in table] for table in filtered),
+                sorted([op_sec.id for op_sec in table] for table in expected),
+            )
+
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().validate_options({**options, "days_off": ["X"]})
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().validate_options({**options, "max_campus_days": 0})
+
+
+class BlockedTimesTest(TestCase):
+    def test_blocked_times(self):
+        # the sections meet at 8:00, 9:00, ... on Monday and Wednesday or Tuesday and Thursday
+        opened_section_id_groups = create_opened_section_id_groups(2, 6)
+        options = {
+            **SearchStatsTest.OPTIONS,
+            "lunch": {"start": "09:30", "end": "10:10"},
+            "blocked": [{"day": "Th", "start": "12:00", "end": "17:00"}],
+        }
+
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(opened_section_id_groups, options)
+        mixin.compile()
+        self.assertEqual(
+            [
+                sorted(start.hour for ((_, start, _), *_) in group)
+                for group in mixin._groups
+            ],
+            [[8, 11, 12], [8, 11, 12]],
+        )
+
+        for window in ({"start": "10:00", "end": "09:00"}, {"start": "9"}, "09:00"):
+            with self.assertRaises(ValueError):
+                mixin.validate_options({**options, "lunch": window})
+        with self.assertRaises(ValueError):
+            mixin.validate_options(
+                {**options, "blocked": [{"start": "12:00", "end": "13:00"}]}
+            )
+
+    def test_fixed_sections_in_blocked_times(self):
+        # the sections meet at 8:00, 9:00, ... on Monday and Wednesday or Tuesday and Thursday
+        opened_section_id_groups = create_opened_section_id_groups(2, 6)
+        options = {
+            **SearchStatsTest.OPTIONS,
+            "lunch": {"start": "09:30", "end": "10:10"},
+            "blocked": [{"day": "Th", "start": "12:00", "end": "17:00"}],
+        }
+        # the fixed section meets at 9:00, during the lunch
+        fixed = opened_section_id_groups[0][1]
+
+        mixin = GenerateTimeTableMixin()
+        mixin.prepare_groups(
+            mixin.with_fixed_sections(opened_section_id_groups[1:], [fixed]), options
+        )
+        mixin.compile()
+        self.assertEqual(
+            [
+                sorted(start.hour for ((_, start, _), *_) in group)
+                for group in mixin._groups
+            ],
+            [[9], [8, 11, 12]],
+        )
+
+        # the other sections of a schedule are kept too, only the alternatives are excluded
+        schedule = [fixed, opened_section_id_groups[1][0]]
+        course_id = OpenedSection.objects.get(id=schedule[1]).section.course_id
+        op_secs = GenerateTimeTableMixin().get_alternative_sections(
+            schedule, course_id, options
+        )
+        self.assertEqual(
+            {op_sec.id for op_sec in op_secs},
+            set(opened_section_id_groups[1][3:5]),
+        )
+
+
+class AlternativeSectionsTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def test_alternatives(self):
+        # the sections meet at 8:00, 9:00, ... on Monday and Wednesday or Tuesday and Thursday
+        opened_section_id_groups = create_opened_section_id_groups(3, 6)
+        course_group = opened_section_id_groups[2]
+        for idx, id_ in enumerate(course_group):
+            OpenedSection.objects.filter(id=id_).update(open_seats=idx % 3)
+        schedule = [group[idx] for idx, group in enumerate(opened_section_id_groups)]
+        course_id = OpenedSection.objects.get(id=schedule[2]).section.course_id
+
+        # the sections of the course in the timetables with the rest of the schedule fixed
+        mixin = GenerateTimeTableMixin()
+        expected = {
+            table[2].id
+            for table in mixin.get_timetables(
+                mixin.with_fixed_sections([course_group], schedule[:2]), self.OPTIONS
+            )
+        } - {schedule[2]}
+
+        op_secs = GenerateTimeTableMixin().get_alternative_sections(
+            schedule, course_id, self.OPTIONS
+        )
+        self.assertTrue(expected)
+        self.assertEqual({op_sec.id for op_sec in op_secs}, expected)
+        self.assertEqual(
+            [op_sec.open_seats for op_sec in op_secs],
+            sorted((op_sec.open_seats for op_sec in op_secs), reverse=True),
+        )
+
+        # only the alternatives are excluded by the options
+        OpenedSection.objects.filter(id=schedule[0]).update(open_seats=0)
+        op_secs = GenerateTimeTableMixin().get_alternative_sections(
+            schedule, course_id, {**self.OPTIONS, "allow_only_open_section": True}
+        )
+        self.assertEqual(
+            {op_sec.id for op_sec in op_secs},
+            {id_ for id_ in expected if course_group.index(id_) % 3},
+        )
+
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_alternative_sections(
+                [], course_id, self.OPTIONS
+            )
+        with self.assertRaises(ValueError):
+            GenerateTimeTableMixin().get_alternative_sections(
+                schedule, str(course_id), self.OPTIONS
+            )
+
+
+class SearchBudgetTest(TestCase):
+    OPTIONS = {**SearchStatsTest.OPTIONS, "allow_consec": 5}
+
+    def setUp(self):
+        self.opened_section_id_groups = create_opened_section_id_groups(4, 6)
+
+    def search(self, budget=None):
+        # searched in-process and without the cache
+        mixin = GenerateTimeTableMixin()
+        mixin.set_budget(budget)
+        mixin.prepare_groups(self.opened_section_id_groups, self.OPTIONS)
+        mixin.generate_timetables()
+        mixin.realize_timetables()
+        return mixin, [
+            [op_sec.id for op_sec in table] for table in mixin.realized_timetables
+        ]
+
+    def count(self, budget=None):
+        mixin = GenerateTimeTableMixin()
+        mixin.set_budget(budget)
+        mixin.prepare_groups(
+            self.opened_section_id_groups, self.OPTIONS, prefetch=False
+        )
+        return mixin, mixin.count_timetables()
+
+    def test_budget(self):
+        mixin, expected = self.search()
+        self.assertFalse(mixin.search_truncated)
+        self.assertGreater(mixin.search_counters["nodes"], 64)
+        _, count = self.count()
+        self.assertEqual(count, len(expected))
+
+        # the timetables found before the budget ran out are kept, in the order of the full search
+        for budget in ({"max_results": 5}, {"max_nodes": 50}, {"deadline": 1e-6}):
+            with self.subTest(budget=budget):
+                mixin, timetables = self.search(budget)
+                self.assertTrue(mixin.search_truncated)
+                self.assertLess(len(timetables), len(expected))
+                self.assertEqual(timetables, expected[: len(timetables)])
+                self.assertEqual(mixin.search_counters["results"], len(timetables))
+        self.assertEqual(len(self.search({"max_results": 5})[1]), 5)
+        # the node that goes over the budget is counted
+        self.assertEqual(
+            self.search({"max_nodes": 50})[0].search_counters["nodes"], 50 + 1
+        )
+
+        # the count so far is a lower bound
+        for budget in ({"max_nodes": 50}, {"deadline": 1e-6}):
+            with self.subTest(budget=budget):
+                mixin, partial = self.count(budget)
+                self.assertTrue(mixin.search_truncated)
+                self.assertLess(partial, count)
+
+
+@override_settings(WIZARD_PARALLEL_WORKERS=2)
+class ParallelBudgetTest(TestCase):
+    OPTIONS = {**SearchStatsTest.OPTIONS, "allow_consec": 5}
+
+    def test_budget(self):
+        # 8 sections in the first group make 8 subproblems, enough for 2 workers
+        opened_section_id_groups = create_opened_section_id_groups(5, 8)
+
+        # the node budget is divided among the subproblems, each of which may go a node over its share
+        mixin = GenerateTimeTableMixin()
+        mixin.set_budget({"max_nodes": 200})
+        mixin.set_workers(True)
+        mixin.prepare_groups(opened_section_id_groups, self.OPTIONS, prefetch=False)
+        mixin.count_timetables()
+        self.assertTrue(mixin.search_truncated)
+        self.assertLessEqual(mixin.search_counters["nodes"], 200 + 8)
+
+        # the workers stop one timetable past the result budget
+        mixin = GenerateTimeTableMixin()
+        mixin.set_budget({"max_results": 5})
+        mixin.set_workers(True)
+        mixin.prepare_groups(opened_section_id_groups, self.OPTIONS)
+        mixin.generate_timetables()
+        mixin.realize_timetables()
+        self.assertLessEqual(len(mixin.generated_timetables), 8 * 6)
+        self.assertTrue(mixin.search_truncated)
+        self.assertEqual(
+            [[op_sec.id for op_sec in table] for table in mixin.realized_timetables],
+            [
+                [op_sec.id for op_sec in table]
+                for table in GenerateTimeTableMixin().get_timetables(
+                    opened_section_id_groups, self.OPTIONS
+                )[:5]
+            ],
+        )
+
+
+class WizardJobTest(TransactionTestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def setUp(self):
+        self.opened_section_id_groups = create_opened_section_id_groups(3, 4)
+        institution = Institution.objects.get()
+        self.user = User.objects.create_user(
+            email="student@example.com",
+            institution=institution.id,
+            department=Department.objects.create(
+                institution=institution, full_name="Computer Science", nickname="CS"
+            ).id,
+            name="Student",
+            password="password",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, **data):
+        return self.client.post(
+            reverse("wizard-jobs"),
+            {"groups": self.opened_section_id_groups, "options": self.OPTIONS, **data},
+            format="json",
+        )
+
+    def poll(self, id, **params):
+        return self.client.get(reverse("wizard-job", args=[id]), params)
+
+    def wait(self, id):
+        for _ in range(200):
+            job = self.poll(id).json()
+            if job["status"] in (WizardJob.DONE, WizardJob.FAILED):
+                return job
+            sleep(0.05)
+        self.fail("The job did not finish")
+
+    def test_job(self):
+        timetables = [
+            [op_sec.id for op_sec in table]
+            for table in GenerateTimeTableMixin().get_timetables(
+                self.opened_section_id_groups, self.OPTIONS
+            )
+        ]
+
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        job = self.wait(response.json()["id"])
+        self.assertEqual(job["status"], WizardJob.DONE)
+        self.assertEqual(job["counters"]["results"], len(timetables))
+
+        # the timetables are paged by offset
+        paged, offset = [], 0
+        while offset is not None:
+            job = self.poll(response.json()["id"], offset=offset, limit=5).json()
+            paged += [[data["id"] for data in table] for table in job["results"]]
+            offset = job["next"]
+        self.assertEqual(paged, timetables)
+
+        # the fixed sections are kept by the job
+        fixed = [self.opened_section_id_groups[0][0]]
+        job = self.wait(self.submit(fixed=fixed).json()["id"])
+        self.assertEqual(job["status"], WizardJob.DONE)
+        self.assertTrue(all(table[0]["id"] == fixed[0] for table in job["results"]))
+
+        self.assertEqual(self.submit(options={}).status_code, 400)
+        self.assertEqual(self.poll(response.json()["id"], limit=0).status_code, 400)
+        self.assertEqual(APIClient().post(reverse("wizard-jobs")).status_code, 401)
+
+        # the jobs of other users are not found
+        other = WizardJob.objects.create(
+            user=User.objects.create_user(
+                email="other@example.com",
+                institution=self.user.institution_id,
+                department=self.user.department_id,
+                name="Other",
+            ),
+            request={},
+        )
+        self.assertEqual(self.poll(other.id).status_code, 404)
+
+    def test_limits(self):
+        for _ in range(2):
+            WizardJob.objects.create(user=self.user, request={})
+        with override_settings(WIZARD_JOBS={"MAX_ACTIVE_PER_USER": 2}):
+            self.assertEqual(self.submit().status_code, 429)
+
+        # the jobs whose thread was lost fail once past the deadline, and no longer count as active
+        WizardJob.objects.update(
+            created_at=timezone.now() - timedelta(seconds=20 + 60 + 1)
+        )
+        with override_settings(
+            WIZARD_JOBS={
+                "MAX_ACTIVE_PER_USER": 2,
+                "GRACE": 60,
+                "SEARCH_LIMITS": {"DEADLINE": 20},
+            }
+        ):
+            response = self.submit()
+            self.assertEqual(response.status_code, 202)
+            self.wait(response.json()["id"])
+            self.assertEqual(
+                WizardJob.objects.filter(
+                    status=WizardJob.FAILED, error="Interrupted"
+                ).count(),
+                2,
+            )
+
+        # the jobs expire after the TTL
+        with override_settings(WIZARD_JOBS={"TTL": 0}):
+            self.assertEqual(self.poll(response.json()["id"]).status_code, 404)
+
+
+class RankTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    @staticmethod
+    def cost(table, rank_by):
+        # computed from the meetings of the sections, independently of the search
+        meetings = [
+            (
+                meeting.day.day,
+                meeting.duration.start_time.hour * 60
+                + meeting.duration.start_time.minute,
+                meeting.duration.end_time.hour * 60 + meeting.duration.end_time.minute,
+            )
+            for op_sec in table
+            for meeting in op_sec.meeting_set.all()
+        ]
+        if rank_by == "latest_start":
+            return -min(start for _, start, _ in meetings)
+        if rank_by == "fewest_days":
+            return len({day for day, _, _ in meetings})
+        if rank_by == "least_idle":
+            idle = 0
+            for day in {day for day, _, _ in meetings}:
+                spans = sorted((start, end) for d, start, end in meetings if d == day)
+                last_end = spans[0][1]
+                for start, end in spans[1:]:
+                    idle += max(start - last_end, 0)
+                    last_end = max(last_end, end)
+            return idle
+        return -sum(op_sec.open_seats or 0 for op_sec in table)
+
+    def test_rankings(self):
+        # the sections meet at 8:00, 9:00, ... on Monday and Wednesday or Tuesday and Thursday
+        opened_section_id_groups = create_opened_section_id_groups(3, 6)
+        for idx, id_ in enumerate(sum(opened_section_id_groups, [])):
+            OpenedSection.objects.filter(id=id_).update(open_seats=idx * 7 % 5)
+        get_cache().clear()
+        timetables = GenerateTimeTableMixin().get_timetables(
+            opened_section_id_groups, self.OPTIONS
+        )
+        all_ids = {tuple(op_sec.id for op_sec in table) for table in timetables}
+
+        for rank_by in GenerateTimeTableMixin.RANKINGS:
+            costs = sorted(self.cost(table, rank_by) for table in timetables)
+            # the costs tie between many timetables, which of them rank first is not specified
+            self.assertLess(len(set(costs)), len(costs))
+            for k in (1, 5, len(timetables), len(timetables) + 1):
+                with self.subTest(rank_by=rank_by, k=k):
+                    ranked = GenerateTimeTableMixin().get_ranked_timetables(
+                        opened_section_id_groups, self.OPTIONS, rank_by, k
+                    )
+                    ids = [tuple(op_sec.id for op_sec in table) for table in ranked]
+                    self.assertEqual(len(set(ids)), len(ids))
+                    self.assertLessEqual(set(ids), all_ids)
+                    self.assertEqual(
+                        [self.cost(table, rank_by) for table in ranked], costs[:k]
+                    )
+
+
+class ScheduleViewTest(TestCase):
+    OPTIONS = SearchStatsTest.OPTIONS
+
+    def setUp(self):
+        # the ids of the sections are reused across tests, and so would be the results cached by another test
+        get_cache().clear()
+        self.opened_section_id_groups = create_opened_section_id_groups(3, 4)
+
+    def post(self, name="generated-time-tables", **data):
+        return APIClient().post(
+            reverse(name),
+            {"groups": self.opened_section_id_groups, "options": self.OPTIONS, **data},
+            format="json",
+        )
+
+    def test_stream(self):
+        expected = self.post().json()
+        self.assertTrue(expected)
+
+        response = self.post(stream="json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), expected)
+
+        response = self.post(stream="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            [
+                json.loads(line)
+                for line in b"".join(response.streaming_content).splitlines()
+            ],
+            expected,
+        )
+
+        for stream in ("json", "ndjson"):
+            with self.subTest(stream=stream):
+                response = self.post(stream=stream, options={})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_rank_by(self):
+        response = self.post(rank_by="fewest_days", k=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+        for data in ({"stream": "json"}, {"limit": 5}, {"cursor": "cursor"}):
+            with self.subTest(data=data):
+                response = self.post(rank_by="fewest_days", **data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+        for data in ({"k": 0}, {"k": "3"}, {"rank_by": "cheapest"}):
+            with self.subTest(data=data):
+                response = self.post(**{"rank_by": "fewest_days", **data})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_budget(self):
+        expected = self.post().json()
+
+        # a request with a budget is wrapped with the search report
+        response = self.post(budget={})
+        self.assertEqual(set(response.json()), {"results", "truncated", "counters"})
+        self.assertEqual(response.json()["results"], expected)
+        self.assertFalse(response.json()["truncated"])
+        self.assertEqual(
+            set(response.json()["counters"]), {"nodes", "results", "seconds"}
+        )
+        self.assertEqual(response.json()["counters"]["results"], len(expected))
+
+        response = self.post("generated-time-tables-count", budget={})
+        self.assertEqual(set(response.json()), {"count", "truncated", "counters"})
+        self.assertEqual(response.json()["count"], len(expected))
+
+        response = self.post(budget={"max_nodes": 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    def test_server_limits(self):
+        expected = self.post().json()
+        self.assertGreater(len(expected), 5)
+        self.assertNotIn("X-Wizard-Truncated", self.post())
+
+        with override_settings(WIZARD_SEARCH_LIMITS={"MAX_RESULTS": 5}):
+            # a plain response keeps its shape, and is flagged when the server caps cut it short
+            response = self.post()
+            self.assertEqual(response.json(), expected[:5])
+            self.assertEqual(response["X-Wizard-Truncated"], "true")
+
+            # the stricter of the request and server limits applies
+            for max_results, results in ((3, 3), (10, 5)):
+                with self.subTest(max_results=max_results):
+                    response = self.post(budget={"max_results": max_results})
+                    self.assertEqual(response.json()["results"], expected[:results])
+                    self.assertTrue(response.json()["truncated"])
+
+        with override_settings(WIZARD_SEARCH_LIMITS={"MAX_NODES": 10}):
+            get_cache().clear()
+            response = self.post()
+            self.assertEqual(response["X-Wizard-Truncated"], "true")
+            self.assertEqual(response.json(), expected[: len(response.json())])
+
+    def test_cached_budget(self):
+        count = self.post("generated-time-tables-count").json()
+
+        # a cached count costs no search node, so it is within any node budget. The result budget bounds the
+        # timetables returned, not a count, whether it is cached or not
+        budget = {"max_nodes": 1, "max_results": 1}
+        response = self.post("generated-time-tables-count", budget=budget)
+        self.assertEqual(response["X-Wizard-Cache"], "hit")
+        self.assertEqual(response.json()["count"], count)
+        self.assertFalse(response.json()["truncated"])
+        self.assertEqual(response.json()["counters"]["nodes"], 0)
+
+        get_cache().clear()
+        response = self.post("generated-time-tables-count", budget=budget)
+        self.assertEqual(response["X-Wizard-Cache"], "miss")
+        self.assertTrue(response.json()["truncated"])
+        self.assertLess(response.json()["count"], count)
+
+        # cached timetables still honour the result budget
+        expected = self.post().json()
+        response = self.post(budget={"max_results": 2})
+        self.assertEqual(response["X-Wizard-Cache"], "hit")
+        self.assertEqual(response.json()["results"], expected[:2])
+        self.assertTrue(response.json()["truncated"])
+        self.assertEqual(response.json()["counters"]["results"], 2)
+
+    def test_compact(self):
+        def expand(compact):
+            return [
+                [compact["sections"][str(id_)] for id_ in schedule]
+                for schedule in compact["schedules"]
+            ]
+
+        n_sections = sum(len(group) for group in self.opened_section_id_groups)
+        for data, key in (
+            ({}, None),
+            ({"limit": 100}, "results"),
+            ({"rank_by": "fewest_days", "k": 100}, None),
+        ):
+            with self.subTest(data=data):
+                expected = self.post(**data).json()
+                expected = expected if key is None else expected[key]
+
+                with mock.patch.object(
+                    OpenedSectionWithCourseNameSerializer,
+                    "to_representation",
+                    autospec=True,
+                    side_effect=OpenedSectionWithCourseNameSerializer.to_representation,
+                ) as to_representation:
+                    compact = self.post(compact=True, **data).json()
+                compact = compact if key is None else compact[key]
+                self.assertEqual(set(compact), {"sections", "schedules"})
+                self.assertEqual(expand(compact), expected)
+                # each section is serialized once, however many timetables it is in
+                self.assertEqual(len(compact["sections"]), n_sections)
+                self.assertEqual(to_representation.call_count, n_sections)
+                self.assertGreater(len(compact["schedules"]), n_sections)
+
+        response = self.post(compact=True, stream="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    def test_parallel(self):
+        for data in (
+            {"rank_by": "fewest_days"},
+            {"stream": "json"},
+            {"limit": 5},
+            {"cursor": "cursor"},
+        ):
+            with self.subTest(data=data):
+                response = self.post(parallel=True, **data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+        response = self.post("generated-time-tables-sample", parallel=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+        response = self.post("generated-time-tables-sample", parallel=False, seed=0)
+        self.assertEqual(response.status_code, 200)
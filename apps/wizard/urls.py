@@ -6,6 +6,11 @@ from . import views
 urlpatterns = [
     path('schedules/', views.GeneratedTimeTableView.as_view(), name='generated-time-tables'), 
     path('schedules/count/', views.GeneratedTimeTableCountView.as_view(), name='generated-time-tables-count'),
+    path('schedules/sample/', views.GeneratedTimeTableSampleView.as_view(), name='generated-time-tables-sample'),
+    path('schedules/alternatives/', views.AlternativeSectionsView.as_view(), name='wizard-alternatives'),
+    path('schedules/cache/', views.WizardCacheStatsView.as_view(), name='wizard-cache-stats'),
+    path('jobs/', views.WizardJobListView.as_view(), name='wizard-jobs'),
+    path('jobs/<uuid:id>/', views.WizardJobView.as_view(), name='wizard-job'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,265 @@
+import base64
+import binascii
+import hashlib
+import heapq
+import json
+import math
+from datetime import datetime, time, timedelta
+from itertools import product
+from typing import NamedTuple
+
+DAYS = ("M", "Tu", "W", "Th", "F", "Sa", "Su")
+DAY_INDEX = {day: idx for idx, day in enumerate(DAYS)}
+MINUTES_PER_DAY = 24 * 60
+
+
+class TimeSlotMasks(NamedTuple):
+    """
+    Bitmasks of a timeslot key. Every weekday owns a block of `bits_per_day` bits, and bit `i` of a block is the `i`-th
+    `slot_minutes` minute slot of that day.
+
+    occupied: slots during which a class takes place
+    padded: occupied slots extended by the minimum interval after each class
+    starts: the slot at which each class starts
+    ends: the slot at which each class ends
+    late: slots at which a class starting would be more than the maximum interval after a class of this key
+    early: slots at which a class ending would be more than the maximum interval before a class of this key
+    """
+
+    occupied: int
+    padded: int
+    starts: int
+    ends: int
+    late: int
+    early: int
+
+
+def to_minutes(value: time | timedelta) -> int:
+    """
+    Convert a time of day or a duration to whole minutes.
+    """
+
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    return value.hour * 60 + value.minute
+
+
+def to_window(window: dict, with_day: bool = False) -> tuple:
+    """
+    Convert a time window like {"day": "Tu", "start": "13:00", "end": "17:00"} to a tuple of (day, start time, end
+    time), or of (start time, end time) without the day. Raises ValueError or TypeError if the window is invalid.
+
+    :param window: A dictionary of "start" and "end" in HH:MM, and of "day" with_day
+    :param with_day: Whether the window is on a given day
+    """
+
+    if not isinstance(window, dict):
+        raise ValueError("Invalid time window")
+
+    start = datetime.strptime(window.get("start"), "%H:%M").time()
+    end = datetime.strptime(window.get("end"), "%H:%M").time()
+    if start >= end:
+        raise ValueError("Invalid time window")
+
+    if not with_day:
+        return start, end
+    if window.get("day") not in DAYS:
+        raise ValueError("Invalid time window")
+    return window["day"], start, end
+
+
+def to_spans(timeslots: tuple[tuple[str, time, time]]) -> tuple[tuple[int, int, int]]:
+    """
+    Convert a timeslot key to a sorted tuple of (day index, start minute, end minute).
+    """
+
+    return tuple(
+        sorted(
+            (DAY_INDEX[day], to_minutes(start), to_minutes(end))
+            for day, start, end in timeslots
+        )
+    )
+
+
+def slot_size(minutes: list[int]) -> int:
+    """
+    Returns the largest slot size in minutes that every given minute value is a multiple of, so that bitmasks built with
+    it are exact. For a catalog on 5 minute boundaries this is 5.
+    """
+
+    return math.gcd(*minutes) or 1
+
+
+def bit_range(start: int, end: int) -> int:
+    """
+    Returns an int with bits [start, end) set.
+    """
+
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def iter_bits(bits: int):
+    """
+    Yields the indices of the set bits of an int in ascending order.
+    """
+
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def to_masks(
+    spans: tuple[tuple[int, int, int]],
+    slot_minutes: int,
+    min_interval: int | None = None,
+    max_interval: int | None = None,
+) -> TimeSlotMasks:
+    """
+    Compile the spans of a timeslot key into TimeSlotMasks.
+
+    :param spans: A tuple of (day index, start minute, end minute)
+    :param slot_minutes: The slot size in minutes, every minute value must be a multiple of it
+    :param min_interval: The minimum interval between classes in minutes
+    :param max_interval: The maximum interval between classes in minutes
+    """
+
+    bits_per_day = MINUTES_PER_DAY // slot_minutes + 1
+    occupied = padded = starts = ends = late = early = 0
+
+    for day, start, end in spans:
+        offset = day * bits_per_day
+        start_slot, end_slot = start // slot_minutes, end // slot_minutes
+
+        occupied |= bit_range(offset + start_slot, offset + end_slot)
+        starts |= 1 << (offset + start_slot)
+        ends |= 1 << (offset + end_slot)
+
+        if min_interval is not None:
+            padded_end_slot = min((end + min_interval) // slot_minutes, bits_per_day)
+            padded |= bit_range(offset + start_slot, offset + padded_end_slot)
+        else:
+            padded |= bit_range(offset + start_slot, offset + end_slot)
+
+        if max_interval is not None:
+            # a class starting after `end + max_interval` or ending before `start - max_interval` is too far away
+            late_slot = (end + max_interval) // slot_minutes + 1
+            early_slot = (start - max_interval) // slot_minutes
+            late |= bit_range(offset + late_slot, offset + bits_per_day)
+            early |= bit_range(offset, offset + max(early_slot, 0))
+
+    return TimeSlotMasks(occupied, padded, starts, ends, late, early)
+
+
+def iter_positions(lengths: list[int], after: tuple[int] | None = None):
+    """
+    Yields every tuple of positions into lists of the given lengths in lexicographic order, i.e. the order of
+    itertools.product, starting right after `after` if given.
+    """
+
+    if after is None:
+        yield from product(*map(range, lengths))
+        return
+
+    # keep a prefix of `after` and advance the position right after it
+    for idx in reversed(range(len(lengths))):
+        for tail in product(
+            range(after[idx] + 1, lengths[idx]), *map(range, lengths[idx + 1 :])
+        ):
+            yield tuple(after[:idx]) + tail
+
+
+def request_fingerprint(
+    opened_section_id_groups, options, fixed_sections=(), version=None
+) -> str:
+    """
+    Returns a short digest of a wizard request and of the data version of its sections, to tell if a cursor belongs
+    to it.
+    """
+
+    canonical = json.dumps(
+        [opened_section_id_groups, options, fixed_sections, version],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def encode_cursor(path: tuple[int], positions: tuple[int], fingerprint: str) -> str:
+    """
+    Encode a position of the wizard search as an opaque cursor.
+
+    :param path: The candidates chosen by the search, in search order
+    :param positions: The positions of the OpenedSection objects picked when realizing the timetable
+    :param fingerprint: The fingerprint of the request
+    """
+
+    data = json.dumps([fingerprint, path, positions], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> tuple[tuple[int], tuple[int]]:
+    """
+    Decode a cursor made by encode_cursor into the search path and realization positions.
+
+    :param cursor: The cursor
+    :param fingerprint: The fingerprint of the request the cursor must belong to
+    """
+
+    try:
+        cursor_fingerprint, path, positions = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        path = tuple(int(c) for c in path)
+        positions = tuple(int(p) for p in positions)
+    except (AttributeError, binascii.Error, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if cursor_fingerprint != fingerprint:
+        raise ValueError("Cursor does not belong to this request")
+
+    return path, positions
+
+
+def iter_best_positions(costs: list[list[int]]):
+    """
+    Yields (total cost, positions) for every way to pick one position from each list of costs, in ascending order of
+    total cost. Each list of costs must be sorted in ascending order.
+    """
+
+    if any(len(c) == 0 for c in costs):
+        return
+
+    positions = (0,) * len(costs)
+    heap = [(sum(c[0] for c in costs), positions, 0)]
+    while heap:
+        total, positions, first = heapq.heappop(heap)
+        yield total, positions
+
+        # advance one position at or after the last advanced one, so that every tuple of positions is pushed once
+        for idx in range(first, len(costs)):
+            if positions[idx] + 1 < len(costs[idx]):
+                successor = (
+                    positions[:idx] + (positions[idx] + 1,) + positions[idx + 1 :]
+                )
+                delta = costs[idx][positions[idx] + 1] - costs[idx][positions[idx]]
+                heapq.heappush(heap, (total + delta, successor, idx))
+
+
+def idle_minutes(spans: list[tuple[int, int, int]]) -> int:
+    """
+    Returns the total minutes between the first and last class of each day that are spent outside of classes.
+    """
+
+    idle = 0
+    last_day = last_end = None
+    for day, start, end in sorted(spans):
+        if day == last_day:
+            idle += max(start - last_end, 0)
+            last_end = max(last_end, end)
+        else:
+            last_day, last_end = day, end
+
+    return idle
@@ -1,61 +1,519 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
 
 from django.core.exceptions import ValidationError
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 
 from apps.wizard.serializers import OpenedSectionWithCourseNameSerializer
 from apps.wizard.mixins import GenerateTimeTableMixin
+from apps.wizard.cache import cache_stats
+from apps.wizard.jobs import fail_stale_jobs, live_jobs, submit_job
+from apps.wizard.models import WizardJob
+from apps.timetables.models import TimeTable
 
 import json
 
 
+def search_response(view, data, envelope_key=None):
+    """
+    Build the response of a wizard search. With envelope_key, the data is wrapped in a dictionary together with the
+    search's truncated flag, counters, and stats if they were asked for. Otherwise the data is returned as is, and a search cut short by the
+    server-wide limits is flagged in the X-Wizard-Truncated header. Whether the result came from the wizard cache is
+    told in the X-Wizard-Cache header.
+
+    :param view: The view that ran the search
+    :param data: The response data
+    :param envelope_key: The key of the data in the dictionary
+    """
+
+    report = view.search_report()
+    if envelope_key is not None:
+        headers = {"X-Wizard-Cache": view.cache_status} if view.cache_status else None
+        return Response({envelope_key: data, **report}, headers=headers)
+
+    headers = {"X-Wizard-Truncated": "true"} if report["truncated"] else {}
+    if view.cache_status is not None:
+        headers["X-Wizard-Cache"] = view.cache_status
+    return Response(data, headers=headers)
+
+
+def serialize_timetables(timetables, compact=False):
+    """
+    Serialize the timetables, serializing each OpenedSection object once however many timetables it is in.
+    In compact form, the serialized sections are keyed by their ID and each timetable is a list of section IDs.
+
+    :param timetables: A list of lists of OpenedSection objects
+    :param compact: Whether to return the compact form
+    """
+
+    op_secs = {}
+    for table in timetables:
+        for op_sec in table:
+            op_secs.setdefault(op_sec.id, op_sec)
+    sections = {
+        data["id"]: data
+        for data in OpenedSectionWithCourseNameSerializer(
+            op_secs.values(), many=True
+        ).data
+    }
+
+    if compact:
+        return {
+            "sections": sections,
+            "schedules": [[op_sec.id for op_sec in table] for table in timetables],
+        }
+    return [[sections[op_sec.id] for op_sec in table] for table in timetables]
+
+
 class GeneratedTimeTableView(GenerateTimeTableMixin, APIView):
+    STREAM_CONTENT_TYPES = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+    }
+
+    PAGE_SIZE = 20
+
     def get(self, request, format=None):
         opened_section_id_groups = request.data.get("groups", None)
         options = request.data.get("options", None)
+        stream = request.data.get("stream", None)
+        limit = request.data.get("limit", None)
+        cursor = request.data.get("cursor", None)
+        rank_by = request.data.get("rank_by", None)
+        k = request.data.get("k", None)
+        fixed = request.data.get("fixed", None)
+        budget = request.data.get("budget", None)
+        parallel = request.data.get("parallel", False)
+        compact = request.data.get("compact", False)
+        stats = request.data.get("stats", False)
 
         try:
             if opened_section_id_groups is None:
                 raise ValidationError("groups are required")
             if options is None:
                 raise ValidationError("options are required")
+            if not isinstance(parallel, bool):
+                raise ValidationError("parallel must be a boolean")
+            if not isinstance(compact, bool):
+                raise ValidationError("compact must be a boolean")
+            if not isinstance(stats, bool):
+                raise ValidationError("stats must be a boolean")
+            if stream is not None and compact:
+                raise ValidationError("stream cannot be used with compact")
+            if stream is not None and stats:
+                raise ValidationError("stream cannot be used with stats")
+            if stream is not None and stream not in self.STREAM_CONTENT_TYPES:
+                raise ValidationError(
+                    f"stream must be one of {list(self.STREAM_CONTENT_TYPES)}"
+                )
+            if stream is not None and (limit is not None or cursor is not None):
+                raise ValidationError("stream cannot be used with limit or cursor")
+            if rank_by is not None and any(
+                param is not None for param in (stream, limit, cursor)
+            ):
+                raise ValidationError(
+                    "rank_by cannot be used with stream, limit or cursor"
+                )
+            # only the full list of timetables is searched in parallel
+            if parallel and any(
+                param is not None for param in (rank_by, stream, limit, cursor)
+            ):
+                raise ValidationError(
+                    "parallel cannot be used with rank_by, stream, limit or cursor"
+                )
         except ValidationError as e:
             return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            self.set_budget(budget)
+            opened_section_id_groups = self.with_fixed_sections(
+                opened_section_id_groups, fixed
+            )
+        except ValueError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        self.set_stats(stats)
+        # the stats are reported in the envelope
+        envelope_key = None if budget is None and not stats else "results"
+
+        if rank_by is not None:
+            try:
+                timetables = self.get_ranked_timetables(
+                    opened_section_id_groups,
+                    options,
+                    rank_by,
+                    self.PAGE_SIZE if k is None else k,
+                )
+            except ValueError as e:
+                return Response(
+                    data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            with self._timed("serialize"):
+                res = serialize_timetables(timetables, compact)
+
+            self.log_search("ranked")
+            return search_response(self, res, envelope_key)
+
+        if limit is not None or cursor is not None:
+            try:
+                timetables, next_cursor = self.get_timetables_page(
+                    opened_section_id_groups,
+                    options,
+                    self.PAGE_SIZE if limit is None else limit,
+                    cursor,
+                )
+            except ValueError as e:
+                return Response(
+                    data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            with self._timed("serialize"):
+                res = serialize_timetables(timetables, compact)
+
+            self.log_search("page")
+            return Response(
+                {"next": next_cursor, "results": res, **self.search_report()}
+            )
+
+        if stream is not None:
+            try:
+                timetables = self.iter_timetables(opened_section_id_groups, options)
+            except ValueError as e:
+                return Response(
+                    data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            return StreamingHttpResponse(
+                self.stream_timetables(timetables, stream),
+                content_type=self.STREAM_CONTENT_TYPES[stream],
+            )
+
+        self.set_workers(parallel)
         timetables = self.get_timetables(opened_section_id_groups, options)
 
-        res = []
-        for table in timetables:
-            res.append(OpenedSectionWithCourseNameSerializer(table, many=True).data)
+        with self._timed("serialize"):
+            res = serialize_timetables(timetables, compact)
 
-        return Response(res)
+        self.log_search("timetables")
+        return search_response(self, res, envelope_key)
 
     def post(self, request, format=None):
         return self.get(request, format)
 
+    def stream_timetables(self, timetables, stream):
+        """
+        Serialize the timetables one at a time, as a JSON array or as newline delimited JSON.
+
+        :param timetables: An iterable of lists of OpenedSection objects
+        :param stream: "json" or "ndjson"
+        """
+
+        encoder = JSONEncoder()
+        separator = "[" if stream == "json" else ""
+        # serialize each OpenedSection object once
+        sections = {}
+        for table in timetables:
+            for op_sec in table:
+                if op_sec.id not in sections:
+                    sections[op_sec.id] = OpenedSectionWithCourseNameSerializer(
+                        op_sec
+                    ).data
+            data = [sections[op_sec.id] for op_sec in table]
+            if stream == "json":
+                yield separator + encoder.encode(data)
+                separator = ","
+            else:
+                yield encoder.encode(data) + "\n"
+
+        if stream == "json":
+            yield "]" if separator == "," else "[]"
+
+        self.log_search("stream")
+
 
 class GeneratedTimeTableCountView(GenerateTimeTableMixin, APIView):
     def get(self, request, format=None):
         opened_section_id_groups = request.data.get("groups", None)
         options = request.data.get("options", None)
+        fixed = request.data.get("fixed", None)
+        budget = request.data.get("budget", None)
+        parallel = request.data.get("parallel", False)
+        stats = request.data.get("stats", False)
+        # true to start an incremental session, or the token of the session to continue
+        session = request.data.get("session", None)
 
         try:
             if opened_section_id_groups is None:
                 raise ValidationError("groups are required")
             if options is None:
                 raise ValidationError("options are required")
+            if not isinstance(parallel, bool):
+                raise ValidationError("parallel must be a boolean")
+            if not isinstance(stats, bool):
+                raise ValidationError("stats must be a boolean")
+            if (
+                session is not None
+                and session is not True
+                and not isinstance(session, str)
+            ):
+                raise ValidationError("session must be true or a session token")
+            if session is not None and parallel:
+                raise ValidationError("session cannot be used with parallel")
         except ValidationError as e:
             return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            self.set_budget(budget)
+            opened_section_id_groups = self.with_fixed_sections(
+                opened_section_id_groups, fixed
+            )
+        except ValueError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.set_stats(stats)
+
+        if session is not None:
+            try:
+                cnt, token = self.get_timetables_count_in_session(
+                    opened_section_id_groups,
+                    options,
+                    None if session is True else session,
+                )
+            except ValueError as e:
+                return Response(
+                    data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            self.log_search("count_session")
+            response = search_response(self, cnt, "count")
+            response.data["session"] = {"token": token, "status": self.session_status}
+            return response
+
+        self.set_workers(parallel)
         cnt = self.get_timetables_count(opened_section_id_groups, options)
 
-        return Response(cnt)
+        self.log_search("count")
+        return search_response(
+            self, cnt, None if budget is None and not stats else "count"
+        )
+
+    def post(self, request, format=None):
+        return self.get(request, format)
+
+
+class GeneratedTimeTableSampleView(GenerateTimeTableMixin, APIView):
+    def get(self, request, format=None):
+        opened_section_id_groups = request.data.get("groups", None)
+        options = request.data.get("options", None)
+        n = request.data.get("n", 1)
+        seed = request.data.get("seed", None)
+        fixed = request.data.get("fixed", None)
+        budget = request.data.get("budget", None)
+        parallel = request.data.get("parallel", False)
+        compact = request.data.get("compact", False)
+        stats = request.data.get("stats", False)
+
+        try:
+            if opened_section_id_groups is None:
+                raise ValidationError("groups are required")
+            if options is None:
+                raise ValidationError("options are required")
+            if parallel is not False:
+                raise ValidationError("sampling cannot be used with parallel")
+            if not isinstance(compact, bool):
+                raise ValidationError("compact must be a boolean")
+            if not isinstance(stats, bool):
+                raise ValidationError("stats must be a boolean")
+        except ValidationError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            self.set_budget(budget)
+            self.set_stats(stats)
+            opened_section_id_groups = self.with_fixed_sections(
+                opened_section_id_groups, fixed
+            )
+            timetables = self.get_sampled_timetables(
+                opened_section_id_groups, options, n, seed
+            )
+        except ValueError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with self._timed("serialize"):
+            res = serialize_timetables(timetables, compact)
+
+        self.log_search("sample")
+        return search_response(
+            self, res, None if budget is None and not stats else "results"
+        )
 
     def post(self, request, format=None):
         return self.get(request, format)
 
 
+class AlternativeSectionsView(GenerateTimeTableMixin, APIView):
+    def get(self, request, format=None):
+        opened_section_ids = request.data.get("sections", None)
+        timetable = request.data.get("timetable", None)
+        course_id = request.data.get("course", None)
+        options = request.data.get("options", None)
+
+        try:
+            if (opened_section_ids is None) == (timetable is None):
+                raise ValidationError("Either sections or timetable is required")
+            if course_id is None:
+                raise ValidationError("course is required")
+            if options is None:
+                raise ValidationError("options are required")
+            if timetable is not None and (
+                not isinstance(timetable, dict)
+                or not isinstance(timetable.get("semester"), int)
+                or not isinstance(timetable.get("order"), int)
+            ):
+                raise ValidationError("timetable must have a semester and an order")
+        except ValidationError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if timetable is not None:
+            # a saved timetable is only looked up among the user's own
+            if not request.user.is_authenticated:
+                self.permission_denied(request)
+            timetable = get_object_or_404(
+                TimeTable,
+                user=request.user,
+                semester__code=timetable["semester"],
+                order=timetable["order"],
+            )
+            opened_section_ids = list(
+                timetable.opened_section_entries.values_list(
+                    "opened_section_id", flat=True
+                )
+            )
+
+        try:
+            op_secs = self.get_alternative_sections(
+                opened_section_ids, course_id, options
+            )
+        except ValueError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with self._timed("serialize"):
+            res = OpenedSectionWithCourseNameSerializer(op_secs, many=True).data
+
+        self.log_search("alternatives")
+        return search_response(self, res)
+
+    def post(self, request, format=None):
+        return self.get(request, format)
+
+
+class WizardJobListView(GenerateTimeTableMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        opened_section_id_groups = request.data.get("groups", None)
+        options = request.data.get("options", None)
+        fixed = request.data.get("fixed", None)
+        budget = request.data.get("budget", None)
+
+        try:
+            if opened_section_id_groups is None:
+                raise ValidationError("groups are required")
+            if options is None:
+                raise ValidationError("options are required")
+        except ValidationError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # validate the request now rather than in the job
+        try:
+            self.validate_opened_section_id_groups(
+                self.with_fixed_sections(opened_section_id_groups, fixed)
+            )
+            self.validate_options(options)
+            self.set_budget(budget)
+        except ValueError as e:
+            return Response(data={"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = submit_job(
+                request.user,
+                {
+                    "groups": opened_section_id_groups,
+                    "fixed": fixed,
+                    "options": options,
+                    "budget": budget,
+                },
+            )
+        except PermissionError as e:
+            return Response(
+                data={"error": str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+        return Response(
+            {"id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class WizardJobView(GenerateTimeTableMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    PAGE_SIZE = 20
+
+    def get(self, request, id, format=None):
+        fail_stale_jobs()
+        job = get_object_or_404(live_jobs(), id=id, user=request.user)
+
+        try:
+            offset = int(request.query_params.get("offset", 0))
+            limit = int(request.query_params.get("limit", self.PAGE_SIZE))
+            if offset < 0 or limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response(
+                data={"error": "Invalid offset or limit"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        compact = request.query_params.get("compact") == "true"
+
+        res = next_offset = None
+        if job.status == WizardJob.DONE:
+            page = job.timetables[offset : offset + limit]
+            op_secs = {
+                op_sec.id: op_sec
+                for op_sec in self.opened_sections(
+                    {id_ for table in page for id_ in table}
+                )
+            }
+            res = serialize_timetables(
+                [[op_secs[id_] for id_ in table] for table in page], compact
+            )
+            if offset + limit < len(job.timetables):
+                next_offset = offset + limit
+
+        return Response(
+            {
+                "id": job.id,
+                "status": job.status,
+                "error": job.error,
+                "truncated": job.truncated,
+                "counters": {"nodes": job.nodes, "results": job.results},
+                "next": next_offset,
+                "results": res,
+            }
+        )
+
+
+class WizardCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(cache_stats())
+
+
 class GeneratedTimeTableTestView(APIView):
     test_request = None
 
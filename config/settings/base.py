@@ -202,3 +202,66 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": True,
 }
+
+
+# Wizard
+
+# server-wide caps on a single wizard search, a request can only ask for stricter limits
+WIZARD_SEARCH_LIMITS = {
+    "DEADLINE": 20,  # seconds
+    "MAX_NODES": 5_000_000,
+    "MAX_RESULTS": 100_000,
+}
+
+# number of processes a wizard search asking for "parallel" is split across, 1 or None to always search in-process
+WIZARD_PARALLEL_WORKERS = 4
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # beyond MAX_ENTRIES, locmem culls 1/CULL_FREQUENCY of the entries, the least recently used first, and deploy's
+    # FileBasedCache culls as many in arbitrary order. The data versions are entries of this cache too, and can be
+    # culled before the results cached under them, see apps.wizard.cache.get_data_version
+    "wizard": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "wizard",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 500},
+    },
+}
+
+WIZARD_CACHE_ALIAS = "wizard"
+# results with more timetables than this are not cached
+WIZARD_CACHE_MAX_RESULT_SIZE = 5_000
+
+# seconds an incremental count session is kept after its last request
+WIZARD_SESSION_TTL = 30 * 60
+# sessions with more timetables than this only keep their pairs of timeslots, not their timetables
+WIZARD_SESSION_MAX_SOLUTIONS = 2_000
+
+WIZARD_JOBS = {
+    "WORKERS": 2,  # threads running jobs in each process
+    "TTL": 60 * 60,  # seconds a job and its timetables are kept
+    "MAX_ACTIVE_PER_USER": 2,
+    # seconds past the search deadline after which an unfinished job is taken for lost, e.g. by a restarted process
+    "GRACE": 60,
+    # caps on the search of a job, looser than on a request
+    "SEARCH_LIMITS": {
+        "DEADLINE": 10 * 60,
+        "MAX_NODES": 100_000_000,
+        "MAX_RESULTS": 200_000,
+    },
+}
+
+# the wizard logs a JSON line per search on the "apps.wizard.mixins" logger, see GenerateTimeTableMixin.log_search
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "apps.wizard": {"handlers": ["console"], "level": "INFO"},
+    },
+}
@@ -39,3 +39,11 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 CSRF_TRUSTED_ORIGINS = [
     'http://augustapp.one',
 ]
+
+# the scraper runs in its own process, and must be able to invalidate the results cached by the web workers
+CACHES["wizard"] = {
+    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+    "LOCATION": BASE_DIR / ".cache" / "wizard",
+    "TIMEOUT": 60 * 60,
+    "OPTIONS": {"MAX_ENTRIES": 500},
+}